@@ -1,69 +1,49 @@
 import sys
 import os
-from PyQt5.QtCore import Qt
+import threading
+import time
+from PyQt5.QtCore import Qt, QThread, pyqtSignal, QAbstractListModel, QModelIndex, QTimer
 from PyQt5.QtWidgets import (QApplication, QWidget, QVBoxLayout, QLabel, QLineEdit, QPushButton, QFileDialog,
                              QTextEdit, QMessageBox, QProgressBar, QRadioButton, QButtonGroup, QHBoxLayout,
-                             QInputDialog, QDialog, QListWidget, QTextBrowser, QListWidgetItem)
-from openai import OpenAI
-import re
-import json
-
-
-class APIKeyManager:
-    def __init__(self, api_key_file='openai_api_key.txt'):
-        self.api_key_file = api_key_file
-        self.api_key = None
-        self.client = None
-
-    def load_api_key(self):
-        if os.path.exists(self.api_key_file):
-            with open(self.api_key_file, 'r') as file:
-                self.api_key = file.read().strip()
-            return True
-        return False
-
-    def save_api_key(self, api_key):
-        with open(self.api_key_file, 'w') as file:
-            file.write(api_key)
-        self.api_key = api_key
-
-    def get_api_key(self):
-        if not self.api_key:
-            if not self.load_api_key():
-                self.request_api_key()
-        return self.api_key
-
-    def request_api_key(self):
-        from PyQt5.QtWidgets import QInputDialog, QLineEdit
-
-        api_key, ok = QInputDialog.getText(
-            None,
-            "Inserisci API Key",
-            "Per favore, inserisci la tua API Key di OpenAI:",
-            QLineEdit.Normal
-        )
-        if ok and api_key:
-            self.save_api_key(api_key)
-        else:
-            raise ValueError("API Key non fornita. Impossibile procedere.")
+                             QInputDialog, QDialog, QListWidget, QTextBrowser, QListWidgetItem, QListView,
+                             QCheckBox, QComboBox)
+
+from renamer import (APIKeyManager, DEFAULT_RULES, MODE_ALL, MODE_FILES, MODE_FOLDERS, PHASE_NAMING,
+                     PHASE_RENAMING, STAGE_MODEL, ContentSampler, LocalTransforms, Metrics, ModelProvider,
+                     RenameEngine, RuleStore, SuggestionCache, ViolationWriter, extract_regex, validate_rule)
+
+
+# Impostazioni e cache stanno accanto al programma, qualunque sia la cartella da cui viene avviato
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+RULES_FILE = os.path.join(APP_DIR, 'rules.json')
+PROVIDER_FILE = os.path.join(APP_DIR, 'provider.json')
+TRANSFORMS_FILE = os.path.join(APP_DIR, 'transforms.json')
+CACHE_FILE = os.path.join(APP_DIR, 'suggestions.sqlite')
 
-    def get_client(self):
-        if not self.client:
-            api_key = self.get_api_key()
-            self.client = OpenAI(api_key=api_key)
-        return self.client
 
 class RuleDialog(QDialog):
-    def __init__(self, parent=None):
+    def __init__(self, provider, parent=None, metrics=None, rules_file=RULES_FILE):
         super().__init__(parent)
-        # Ensure you correctly retrieve the API key from the environment variables
-        self.api_manager = APIKeyManager()
-        self.client = self.api_manager.get_client()
+        # Stesso client e stesse connessioni della finestra principale
+        self.provider = provider
+        self.metrics = metrics or Metrics()
 
         self.setWindowTitle("Gestione Regole")
         self.setGeometry(300, 300, 600, 400)  # Increased width for better visibility
         self.layout = QVBoxLayout(self)
 
+        profileLayout = QHBoxLayout()
+        profileLayout.addWidget(QLabel("Profilo:"))
+        self.profileCombo = QComboBox()
+        profileLayout.addWidget(self.profileCombo, 1)
+        self.newProfileButton = QPushButton("Nuovo Profilo")
+        self.deleteProfileButton = QPushButton("Elimina Profilo")
+        profileLayout.addWidget(self.newProfileButton)
+        profileLayout.addWidget(self.deleteProfileButton)
+        self.layout.addLayout(profileLayout)
+        self.newProfileButton.clicked.connect(self.newProfile)
+        self.deleteProfileButton.clicked.connect(self.deleteProfile)
+
         self.ruleList = QListWidget()
         self.ruleList.setWordWrap(True)  # Enable word wrap for long descriptions
         self.layout.addWidget(self.ruleList)
@@ -87,16 +67,14 @@ class RuleDialog(QDialog):
         self.helpButton.clicked.connect(self.showHelp)
         self.aiButton.clicked.connect(self.generateRuleWithAI)
 
-
-        self.defaultRules = [
-            ("Solo lettere, numeri, underscore e trattini", r'^[a-zA-Z0-9_-]+$'),
-            ("Non inizia con un punto", r'^[^.]+$'),
-            ("Lunghezza tra 1 e 255 caratteri", r'^.{1,255}$'),
-        ]
-        self.rules_file = 'rules.json'  # Aggiungi questa riga
+        # Le regole vengono lette una volta sola; le modifiche sono salvate in blocco poco dopo e alla chiusura
+        self.defaultRules = list(DEFAULT_RULES)
+        self.rules_file = rules_file
+        self.store = RuleStore(self.rules_file, self.defaultRules)
+        self.profileCombo.addItems(self.store.profile_names())
+        self.profileCombo.setCurrentText(self.store.active)
+        self.profileCombo.currentTextChanged.connect(self.selectProfile)
         self.loadRules()
-        if self.ruleList.count() == 0:
-            self.loadDefaultRules()
 
 
     def showHelp(self):
@@ -151,9 +129,37 @@ class RuleDialog(QDialog):
 
         helpDialog.exec_()
 
-    def loadDefaultRules(self):
-        for description, regex in self.defaultRules:
-            self.addRuleToList(description, regex)
+    def selectProfile(self, name):
+        if name:
+            self.store.set_active(name)
+            self.loadRules()
+
+    def newProfile(self):
+        name, ok = QInputDialog.getText(self, "Nuovo Profilo",
+                                        "Nome del profilo (ad esempio l'archivio di un cliente):")
+        if ok and name:
+            try:
+                # Il nuovo profilo parte dalle regole del profilo corrente
+                self.store.create_profile(name, self.store.rules())
+            except ValueError as e:
+                QMessageBox.warning(self, "Errore", str(e))
+                return
+            self.profileCombo.addItem(name.strip())
+            self.profileCombo.setCurrentText(name.strip())
+
+    def deleteProfile(self):
+        name = self.store.active
+        reply = QMessageBox.question(self, "Elimina Profilo", f"Eliminare il profilo {name}?",
+                                     QMessageBox.Yes | QMessageBox.No)
+        if reply != QMessageBox.Yes:
+            return
+        try:
+            self.store.delete_profile(name)
+        except ValueError as e:
+            QMessageBox.warning(self, "Errore", str(e))
+            return
+        self.profileCombo.removeItem(self.profileCombo.findText(name))
+        self.profileCombo.setCurrentText(self.store.active)
 
 
     def generateRuleWithAI(self):
@@ -162,71 +168,83 @@ class RuleDialog(QDialog):
         if ok and description:
             try:
                 regex = self.getRegexFromAI(description)
-                self.addRuleToList(description, regex)
-                QMessageBox.information(self, "Successo", f"Regola generata: {regex}")
             except Exception as e:
                 QMessageBox.warning(self, "Errore", f"Errore nella generazione della regola: {str(e)}")
+                return
+            # La regola generata viene salvata solo se supera i controlli e il corpus di prova
+            if self.validateRule(regex):
+                self.addRuleToList(description, regex)
+                self.saveRules()
+                QMessageBox.information(self, "Successo", f"Regola generata: {regex}")
+
+    def validateRule(self, regex):
+        try:
+            validate_rule(regex)
+            return True
+        except (ValueError, OSError) as e:
+            QMessageBox.warning(self, "Regola non valida", str(e))
+            return False
 
     def getRegexFromAI(self, description):
         prompt = f"Genera un'espressione regolare per la seguente descrizione: {description}. " \
                  f"Fornisci solo l'espressione regolare, senza spiegazioni."
 
-        response = self.client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": "Sei un esperto di espressioni regolari. " \
-                                              "Genera espressioni regolari precise e concise."},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=50,
-            n=1,
-            temperature=0.7
-        )
-
-        regex = response.choices[0].message.content.strip()
+        with self.metrics.timer(STAGE_MODEL):
+            response = self.provider.complete(
+                [
+                    {"role": "system", "content": "Sei un esperto di espressioni regolari. " \
+                                                  "Genera espressioni regolari precise e concise."},
+                    {"role": "user", "content": prompt}
+                ],
+                max_tokens=50,
+                temperature=0
+            )
+        self.metrics.record_usage(self.provider.model, getattr(response, 'usage', None))
+
+        regex = extract_regex(response.choices[0].message.content)
         return regex
 
     def getRules(self):
-        return [self.ruleList.item(i).data(Qt.UserRole) for i in range(self.ruleList.count())]
+        return self.store.rules()
 
     def loadRules(self):
-        if os.path.exists(self.rules_file):
-            with open(self.rules_file, 'r') as f:
-                rules = json.load(f)
-            self.ruleList.clear()
-            for description, regex in rules:
-                self.addRuleToList(description, regex)
-        else:
-            self.loadDefaultRules()
+        self.ruleList.clear()
+        for description, regex in self.store.rules():
+            self.addRuleToList(description, regex)
 
     def saveRules(self):
-        rules = [self.ruleList.item(i).data(Qt.UserRole) for i in range(self.ruleList.count())]
-        with open(self.rules_file, 'w') as f:
-            json.dump(rules, f)
+        # Solo in memoria: lo store scrive il file una volta per gruppo di modifiche
+        self.store.set_rules([self.ruleList.item(i).data(Qt.UserRole) for i in range(self.ruleList.count())])
 
-    def addRuleToList(self, description, regex):
+    def addRuleToList(self, description, regex, row=None):
         item = QListWidgetItem(f"{description}: {regex}")
         item.setData(Qt.UserRole, (description, regex))
-        self.ruleList.addItem(item)
-        self.saveRules()
+        if row is None:
+            self.ruleList.addItem(item)
+        else:
+            self.ruleList.insertItem(row, item)
+        return item
 
     def addRule(self):
         regex, ok = QInputDialog.getText(self, "Aggiungi Regola", "Inserisci la nuova regola (espressione regolare):")
-        if ok and regex:
+        if ok and regex and self.validateRule(regex):
             description, ok = QInputDialog.getText(self, "Aggiungi Descrizione", "Inserisci una breve descrizione della regola:")
             if ok:
                 self.addRuleToList(description, regex)
+                self.saveRules()
 
     def editRule(self):
         currentItem = self.ruleList.currentItem()
         if currentItem:
             oldDescription, oldRegex = currentItem.data(Qt.UserRole)
             newRegex, ok = QInputDialog.getText(self, "Modifica Regola", "Modifica la regola:", text=oldRegex)
-            if ok and newRegex:
+            if ok and newRegex and self.validateRule(newRegex):
                 newDescription, ok = QInputDialog.getText(self, "Modifica Descrizione", "Modifica la descrizione:", text=oldDescription)
                 if ok:
-                    self.ruleList.takeItem(self.ruleList.row(currentItem))
-                    self.addRuleToList(newDescription, newRegex)
+                    row = self.ruleList.row(currentItem)
+                    self.ruleList.takeItem(row)
+                    self.ruleList.setCurrentItem(self.addRuleToList(newDescription, newRegex, row))
+                    self.saveRules()
 
     def deleteRule(self):
         currentItem = self.ruleList.currentItem()
@@ -235,70 +253,283 @@ class RuleDialog(QDialog):
             self.saveRules()
 
     def closeEvent(self, event):
-        self.saveRules()
+        self.store.flush()
         super().closeEvent(event)
 
 
+class ViolationListModel(QAbstractListModel):
+    # Righe esposte alla vista per volta: la lista viene disegnata solo quando serve
+    FETCH_BATCH = 1000
+    # Righe tenute in memoria: le altre vengono solo contate, l'elenco completo è nel file esportato
+    MAX_ROWS = 10000
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.violations = []
+        self.loaded = 0
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self.loaded
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        violation = self.violations[index.row()]
+        if role == Qt.DisplayRole:
+            return f"{violation.path}: {violation.reason}"
+        if role == Qt.ToolTipRole:
+            return violation.path
+        if role == Qt.UserRole:
+            return violation
+        return None
+
+    def canFetchMore(self, parent):
+        return not parent.isValid() and self.loaded < len(self.violations)
+
+    def fetchMore(self, parent):
+        count = min(self.FETCH_BATCH, len(self.violations) - self.loaded)
+        if count <= 0:
+            return
+        self.beginInsertRows(QModelIndex(), self.loaded, self.loaded + count - 1)
+        self.loaded += count
+        self.endInsertRows()
+
+    def addViolations(self, violations):
+        self.violations.extend(violations[:max(0, self.MAX_ROWS - len(self.violations))])
+        # Finché la vista non è piena si mostrano subito i nuovi risultati
+        if self.loaded < self.FETCH_BATCH:
+            self.fetchMore(QModelIndex())
+
+    def clear(self):
+        self.beginResetModel()
+        self.violations = []
+        self.loaded = 0
+        self.endResetModel()
+
+
+class ScanWorker(QThread):
+    batchFound = pyqtSignal(list)
+    failed = pyqtSignal(str)
+
+    BATCH_SIZE = 500
+    BATCH_INTERVAL = 0.2
+
+    def __init__(self, engine, directory, export_path=None, parent=None):
+        super().__init__(parent)
+        self.engine = engine
+        self.directory = directory
+        self.export_path = export_path
+        self.stop_event = threading.Event()
+        self.ruleset = None
+        self.found = 0
+
+    @property
+    def checked(self):
+        return self.ruleset.checked if self.ruleset else 0
+
+    def cancel(self):
+        self.stop_event.set()
+
+    def run(self):
+        writer = None
+        batch = []
+        try:
+            self.ruleset = self.engine.compile_rules()
+            writer = ViolationWriter(self.export_path) if self.export_path else None
+            last_emit = time.monotonic()
+            for violation in self.engine.check_results(self.directory, self.ruleset, stop=self.stop_event):
+                self.found += 1
+                # Oltre MAX_ROWS le violazioni vengono solo contate ed esportate
+                if self.found <= ViolationListModel.MAX_ROWS:
+                    batch.append(violation)
+                if writer:
+                    writer.write(violation)
+                if batch and (len(batch) >= self.BATCH_SIZE or time.monotonic() - last_emit >= self.BATCH_INTERVAL):
+                    self.batchFound.emit(batch)
+                    batch = []
+                    last_emit = time.monotonic()
+        except Exception as e:
+            self.failed.emit(str(e))
+        finally:
+            if batch:
+                self.batchFound.emit(batch)
+            if writer:
+                writer.close()
+            if self.ruleset:
+                self.ruleset.close()
+
+
+class RenameWorker(QThread):
+    failed = pyqtSignal(str)
+
+    def __init__(self, engine, directory, prompt, parent=None):
+        super().__init__(parent)
+        self.engine = engine
+        self.directory = directory
+        self.prompt = prompt
+        self.stop_event = threading.Event()
+        self.renamed = []
+        self.error = None
+
+    def cancel(self):
+        self.stop_event.set()
+
+    def run(self):
+        try:
+            self.renamed = self.engine.rename(self.directory, self.prompt, stop=self.stop_event)
+        except Exception as e:
+            self.error = str(e)
+            self.failed.emit(self.error)
+
+
+def format_eta(seconds):
+    if seconds is None:
+        return "--:--"
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes:02d}:{seconds:02d}"
+
+
 class FileRenamerApp(QWidget):
     def __init__(self):
         super().__init__()
-        # Ensure you correctly retrieve the API key from the environment variables
-
-        self.api_manager = APIKeyManager()
-        self.client = self.api_manager.get_client()
-        self.ruleDialog = RuleDialog(self)
+        # Un solo provider per tutta l'applicazione: modello, server e connessioni da provider.json
+        try:
+            self.provider = ModelProvider.load(PROVIDER_FILE, api_manager=APIKeyManager())
+        except ValueError as e:
+            QMessageBox.warning(self, 'Errore', f'provider.json non valido, uso le impostazioni predefinite: {str(e)}')
+            self.provider = ModelProvider(APIKeyManager())
+        # La API Key viene chiesta all'avvio, se serve
+        self.provider.client
+        # Cache condivisa: Rinomina riusa i nomi già mostrati in Anteprima
+        self.cache = SuggestionCache(CACHE_FILE)
+        # Metriche dell'intera sessione: tempi, token e costo di tutte le chiamate
+        self.metrics = Metrics()
+        self.ruleDialog = RuleDialog(self.provider, self, self.metrics)
         self.initUI()
 
     def showRuleDialog(self):
         self.ruleDialog.exec_()
+        self.update_metrics()
+
+    def update_metrics(self):
+        self.metricsLabel.setText(self.metrics.describe())
+
+    def export_metrics(self):
+        path, _ = QFileDialog.getSaveFileName(self, 'Esporta Metriche', 'metrics.json', 'JSON (*.json)')
+        if not path:
+            return
+        try:
+            self.metrics.write_json(path)
+        except OSError as e:
+            QMessageBox.critical(self, 'Errore', f'Impossibile salvare le metriche: {str(e)}')
+
+    def selected_mode(self):
+        if self.filesOnlyRadio.isChecked():
+            return MODE_FILES
+        if self.foldersOnlyRadio.isChecked():
+            return MODE_FOLDERS
+        if self.allRadio.isChecked():
+            return MODE_ALL
+        return None
+
+    def local_transforms(self):
+        if not self.localPassCheckBox.isChecked():
+            return None
+        try:
+            return LocalTransforms.load(TRANSFORMS_FILE)
+        except ValueError as e:
+            QMessageBox.warning(self, 'Errore', f'transforms.json non valido, correzione locale disattivata: {str(e)}')
+            return None
+
+    def engine(self):
+        transforms = self.local_transforms()
+        return RenameEngine(provider=self.provider, mode=self.selected_mode(), rule_store=self.ruleDialog.store,
+                            cache=self.cache, transforms=transforms, metrics=self.metrics,
+                            content=ContentSampler() if self.contentCheckBox.isChecked() else None)
 
     def check_poorly_named_items(self, directory):
-        rules = self.ruleDialog.getRules()
-        poorly_named_items = []
-
-        for root, dirs, files in os.walk(directory):
-            items = dirs + files if self.allRadio.isChecked() else \
-                dirs if self.foldersOnlyRadio.isChecked() else \
-                    files if self.filesOnlyRadio.isChecked() else []
-
-            for item in items:
-                full_path = os.path.join(root, item)
-                failed_rules = []
-                for i, (description, rule) in enumerate(rules, 1):
-                    if not re.match(rule, item):
-                        # Ignora la regola del punto iniziale per i file con estensione
-                        if not (os.path.isfile(full_path) and description == "Non inizia con un punto"):
-                            failed_rules.append(f"Regola {i}")
-
-                if failed_rules:
-                    poorly_named_items.append((full_path, f"Non segue le regole: {', '.join(failed_rules)}"))
-                elif os.path.isfile(full_path) and not os.path.splitext(item)[1] and self.filesOnlyRadio.isChecked():
-                    poorly_named_items.append((full_path, "File senza estensione"))
-                elif len(item) > 255:
-                    poorly_named_items.append((full_path, "Nome troppo lungo"))
-
-        return poorly_named_items
+        return self.engine().check(directory)
 
     def highlight_poorly_named_items(self):
         directory = self.pathEdit.text()
         if not directory:
             QMessageBox.warning(self, 'Errore', 'Per favore, seleziona una cartella.')
             return
+        if self.scanWorker and self.scanWorker.isRunning():
+            return
 
-        poorly_named_items = self.check_poorly_named_items(directory)
+        export_path = None
+        if self.exportCheckBox.isChecked():
+            export_path, _ = QFileDialog.getSaveFileName(self, 'Esporta Violazioni', '',
+                                                         'CSV (*.csv);;JSON Lines (*.jsonl)')
+            if not export_path:
+                return
+
+        self.violationModel.clear()
+        self.resultsView.setVisible(True)
+        self.previewArea.setText("Scansione in corso...")
+        self.highlightButton.setEnabled(False)
+        self.cancelScanButton.setEnabled(True)
+
+        self.scanWorker = ScanWorker(self.engine(), directory, export_path, self)
+        self.scanWorker.batchFound.connect(self.violationModel.addViolations)
+        self.scanWorker.failed.connect(self.scan_failed)
+        self.scanWorker.finished.connect(self.scan_finished)
+        self.scanTimer.start()
+        self.scanWorker.start()
+
+    def cancel_scan(self):
+        if self.scanWorker:
+            self.scanWorker.cancel()
+            self.cancelScanButton.setEnabled(False)
+
+    def update_scan_status(self):
+        self.update_metrics()
+        if self.scanWorker:
+            self.scanStatusLabel.setText(f"Controllati: {self.scanWorker.checked} - "
+                                         f"Problematici: {self.scanWorker.found}")
 
-        if poorly_named_items:
-            report = "Elementi con nomi problematici:\n\n"
-            for item, reason in poorly_named_items:
-                report += f"{item}: {reason}\n"
+    def closeEvent(self, event):
+        for worker in (self.scanWorker, self.renameWorker):
+            if worker and worker.isRunning():
+                worker.cancel()
+                worker.wait()
+        self.ruleDialog.store.close()
+        self.provider.close()
+        super().closeEvent(event)
 
-            # Aggiungi la lista delle regole alla fine del report
-            report += "\nRegole applicate:\n"
-            for i, (description, rule) in enumerate(self.ruleDialog.getRules(), 1):
-                report += f"Regola {i}: {description} ({rule})\n"
-        else:
-            report = "Nessun elemento con nome problematico trovato."
+    def scan_failed(self, message):
+        QMessageBox.critical(self, 'Errore', f'Si è verificato un errore durante la scansione: {message}')
+
+    def scan_finished(self):
+        self.scanTimer.stop()
+        self.update_scan_status()
+        self.highlightButton.setEnabled(True)
+        self.cancelScanButton.setEnabled(False)
 
+        if self.scanWorker.stop_event.is_set():
+            report = "Scansione annullata.\n"
+        elif self.scanWorker.found:
+            report = f"Elementi con nomi problematici: {self.scanWorker.found}\n"
+        else:
+            report = "Nessun elemento con nome problematico trovato.\n"
+        shown = len(self.violationModel.violations)
+        if self.scanWorker.found > shown:
+            report += f"L'elenco mostra i primi {shown} elementi; "
+            if self.scanWorker.export_path:
+                report += "l'elenco completo è nel file esportato.\n"
+            else:
+                report += "per l'elenco completo attiva l'esportazione su file.\n"
+        if self.scanWorker.export_path:
+            report += f"Violazioni esportate in: {self.scanWorker.export_path}\n"
+        if self.scanWorker.ruleset:
+            for message in self.scanWorker.ruleset.warnings():
+                report += f"{message}\n"
+
+        report += "\nRegole applicate:\n"
+        for i, (description, rule) in enumerate(self.ruleDialog.getRules(), 1):
+            report += f"Regola {i}: {description} ({rule})\n"
         self.previewArea.setText(report)
 
     def get_custom_rules(self):
@@ -339,6 +570,11 @@ class FileRenamerApp(QWidget):
         optionsLayout.addWidget(self.foldersOnlyRadio)
         optionsLayout.addWidget(self.allRadio)
         layout.addLayout(optionsLayout)
+        # Spazi, maiuscole, date e caratteri non validi sistemati in locale (transforms.json)
+        self.localPassCheckBox = QCheckBox("Correggi in locale prima dell'AI", self)
+        layout.addWidget(self.localPassCheckBox)
+        self.contentCheckBox = QCheckBox("Usa il contenuto dei file (testo, titolo, data)", self)
+        layout.addWidget(self.contentCheckBox)
 
         # Prompt input
         self.promptLabel = QLabel('Inserisci il prompt per rinominare:')
@@ -356,11 +592,30 @@ class FileRenamerApp(QWidget):
         self.renameButton = QPushButton('Rinomina', self)
         self.renameButton.clicked.connect(self.rename_items)
         layout.addWidget(self.renameButton)
+        self.undoButton = QPushButton('Annulla Ultima Rinomina', self)
+        self.undoButton.setEnabled(False)
+        self.undoButton.clicked.connect(self.undo_last_rename)
+        layout.addWidget(self.undoButton)
+        self.lastJournalPath = None
 
         # Progress bar
         self.progressBar = QProgressBar(self)
         self.progressBar.setVisible(False)
         layout.addWidget(self.progressBar)
+        renameStatusLayout = QHBoxLayout()
+        self.renameStatusLabel = QLabel('', self)
+        self.renameStatusLabel.setVisible(False)
+        renameStatusLayout.addWidget(self.renameStatusLabel)
+        self.cancelRenameButton = QPushButton('Annulla Rinomina', self)
+        self.cancelRenameButton.setVisible(False)
+        self.cancelRenameButton.clicked.connect(self.cancel_rename)
+        renameStatusLayout.addWidget(self.cancelRenameButton)
+        layout.addLayout(renameStatusLayout)
+
+        self.renameWorker = None
+        self.renameTimer = QTimer(self)
+        self.renameTimer.setInterval(500)
+        self.renameTimer.timeout.connect(self.update_rename_status)
 
         # Preview area
         self.previewArea = QTextEdit(self)
@@ -377,6 +632,40 @@ class FileRenamerApp(QWidget):
         self.highlightButton.clicked.connect(self.highlight_poorly_named_items)
         layout.addWidget(self.highlightButton)
 
+        # Risultati della scansione: vengono aggiunti a blocchi mentre il controllo prosegue
+        scanLayout = QHBoxLayout()
+        self.exportCheckBox = QCheckBox('Esporta su file durante la scansione', self)
+        scanLayout.addWidget(self.exportCheckBox)
+        self.scanStatusLabel = QLabel('', self)
+        scanLayout.addWidget(self.scanStatusLabel)
+        self.cancelScanButton = QPushButton('Annulla Scansione', self)
+        self.cancelScanButton.setEnabled(False)
+        self.cancelScanButton.clicked.connect(self.cancel_scan)
+        scanLayout.addWidget(self.cancelScanButton)
+        layout.addLayout(scanLayout)
+
+        self.violationModel = ViolationListModel(self)
+        self.resultsView = QListView(self)
+        self.resultsView.setUniformItemSizes(True)
+        self.resultsView.setModel(self.violationModel)
+        self.resultsView.setVisible(False)
+        layout.addWidget(self.resultsView)
+
+        self.scanWorker = None
+        self.scanTimer = QTimer(self)
+        self.scanTimer.setInterval(200)
+        self.scanTimer.timeout.connect(self.update_scan_status)
+
+        # Tempi, token e costo stimato della sessione
+        metricsLayout = QHBoxLayout()
+        self.metricsLabel = QLabel('', self)
+        metricsLayout.addWidget(self.metricsLabel)
+        self.exportMetricsButton = QPushButton('Esporta Metriche', self)
+        self.exportMetricsButton.clicked.connect(self.export_metrics)
+        metricsLayout.addWidget(self.exportMetricsButton)
+        layout.addLayout(metricsLayout)
+        self.update_metrics()
+
         self.setLayout(layout)
 
     def browse_folder(self):
@@ -387,6 +676,7 @@ class FileRenamerApp(QWidget):
     def suggest_prompt(self):
         suggested_prompt = self.get_ai_suggestion("Suggerisci un prompt per rinominare file e cartelle")
         self.promptEdit.setText(suggested_prompt)
+        self.update_metrics()
 
     def preview_changes(self):
         directory = self.pathEdit.text()
@@ -399,6 +689,7 @@ class FileRenamerApp(QWidget):
         try:
             preview_text = self.get_preview(directory, prompt)
             self.previewArea.setText(preview_text)
+            self.update_metrics()
         except Exception as e:
             QMessageBox.critical(self, 'Errore', f'Si è verificato un errore durante l anteprima: {str(e)}')
 
@@ -409,96 +700,94 @@ class FileRenamerApp(QWidget):
         if not directory or not prompt:
             QMessageBox.warning(self, 'Errore', 'Per favore, inserisci tutti i campi richiesti.')
             return
+        if self.selected_mode() is None:
+            QMessageBox.warning(self, 'Errore', 'Nessuna opzione di rinomina selezionata.')
+            return
+        if self.renameWorker and self.renameWorker.isRunning():
+            return
 
         self.progressBar.setVisible(True)
-        self.progressBar.setValue(0)
+        self.progressBar.setRange(0, 0)
+        self.renameStatusLabel.setText("Preparazione...")
+        self.renameStatusLabel.setVisible(True)
+        self.renameButton.setEnabled(False)
+        self.previewButton.setEnabled(False)
+        self.cancelRenameButton.setVisible(True)
+        self.cancelRenameButton.setEnabled(True)
+
+        self.renameWorker = RenameWorker(self.engine(), directory, prompt, self)
+        self.renameWorker.failed.connect(self.rename_failed)
+        self.renameWorker.finished.connect(self.rename_finished)
+        self.renameTimer.start()
+        self.renameWorker.start()
+
+    def cancel_rename(self):
+        if self.renameWorker:
+            self.renameWorker.cancel()
+            self.cancelRenameButton.setEnabled(False)
+            self.renameStatusLabel.setText("Annullamento dopo il blocco in corso...")
+
+    def update_rename_status(self):
+        self.update_metrics()
+        if not self.renameWorker:
+            return
+        status = self.renameWorker.engine.progress.snapshot()
+        if not status['phase']:
+            return
+        if status['total']:
+            self.progressBar.setRange(0, status['total'])
+            self.progressBar.setValue(status['done'])
+        phase = {PHASE_NAMING: "Richiesta nomi", PHASE_RENAMING: "Rinomina"}[status['phase']]
+        self.renameStatusLabel.setText(
+            f"{phase}: {status['done']}/{status['total']} - {status['rate']:.1f} elementi/s - "
+            f"ETA {format_eta(status['eta'])} - richieste in corso: {status['in_flight']} "
+            f"(totali: {status['api_calls']})"
+        )
 
-        try:
-            if self.filesOnlyRadio.isChecked():
-                self.rename_files_only(directory, prompt)
-            elif self.foldersOnlyRadio.isChecked():
-                self.rename_folders_only(directory, prompt)
-            elif self.allRadio.isChecked():
-                self.rename_all(directory, prompt)
-            else:
-                raise ValueError("Nessuna opzione di rinomina selezionata")
+    def rename_failed(self, message):
+        QMessageBox.critical(self, 'Errore', f'Si è verificato un errore: {message}')
 
+    def rename_finished(self):
+        self.renameTimer.stop()
+        self.update_metrics()
+        self.progressBar.setVisible(False)
+        self.renameStatusLabel.setVisible(False)
+        self.cancelRenameButton.setVisible(False)
+        self.renameButton.setEnabled(True)
+        self.previewButton.setEnabled(True)
+
+        if self.renameWorker.engine.last_journal:
+            self.lastJournalPath = self.renameWorker.engine.last_journal.path
+            self.undoButton.setEnabled(True)
+        if self.renameWorker.error:
+            return
+        if self.renameWorker.stop_event.is_set():
+            QMessageBox.information(self, 'Annullato', f'Rinomina annullata. Elementi rinominati: '
+                                                       f'{len(self.renameWorker.renamed)}.')
+        else:
             QMessageBox.information(self, 'Successo', 'Gli elementi sono stati rinominati con successo.')
+
+    def undo_last_rename(self):
+        if not self.lastJournalPath:
+            return
+        answer = QMessageBox.question(self, 'Annulla Rinomina',
+                                      f'Ripristinare i nomi originali registrati in {self.lastJournalPath}?')
+        if answer != QMessageBox.Yes:
+            return
+        try:
+            restored = self.engine().undo_journal(self.lastJournalPath)
+            QMessageBox.information(self, 'Successo', f'Nomi originali ripristinati: {len(restored)}.')
+            self.undoButton.setEnabled(False)
         except Exception as e:
-            QMessageBox.critical(self, 'Errore', f'Si è verificato un errore: {str(e)}')
-        finally:
-            self.progressBar.setVisible(False)
-
-    def rename_all(self, directory, prompt):
-        for root, dirs, files in os.walk(directory, topdown=False):
-            items = dirs + files
-            new_names = self.get_new_file_names(items, prompt)
-            for old_name, new_name in zip(items, new_names):
-                old_path = os.path.join(root, old_name)
-                new_path = os.path.join(root, self.sanitize_filename(new_name))
-                os.rename(old_path, new_path)
-
-    def rename_files_only(self, directory, prompt):
-        for root, _, files in os.walk(directory):
-            new_names = self.get_new_file_names(files, prompt)
-            for old_name, new_name in zip(files, new_names):
-                old_path = os.path.join(root, old_name)
-                new_path = os.path.join(root, self.sanitize_filename(new_name))
-                os.rename(old_path, new_path)
-
-    def rename_folders_only(self, directory, prompt):
-        for root, dirs, _ in os.walk(directory, topdown=False):
-            new_names = self.get_new_file_names(dirs, prompt)
-            for old_name, new_name in zip(dirs, new_names):
-                old_path = os.path.join(root, old_name)
-                new_path = os.path.join(root, self.sanitize_filename(new_name))
-                os.rename(old_path, new_path)
+            QMessageBox.critical(self, 'Errore', f'Si è verificato un errore durante il ripristino: {str(e)}')
 
     def get_ai_suggestion(self, prompt):
-        response = self.client.chat.completions.create(
-            model="gpt-4o",  # Assicurati di avere accesso a GPT-4
-            messages=[
-                {"role": "system", "content": "Sei un assistente esperto nella rinominazione dei file."},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=100,
-            n=1,
-            temperature=0.7
-        )
-        return response.choices[0].message.content.strip()
-
-    def get_new_file_names(self, file_names, prompt):
-        model_prompt = f"{prompt}\n\nEcco gli elementi da rinominare:\n"
-        for file_name in file_names:
-            model_prompt += f"- {file_name}\n"
-        model_prompt += "\nPer favore, fornisci solo l'elenco dei nuovi nomi, uno per riga, senza numerazione o trattini."
-
-        response = self.client.chat.completions.create(
-            model="gpt-4o",  # Assicurati di avere accesso a GPT-4
-            messages=[
-                {"role": "system", "content": "Sei un assistente esperto nella rinominazione dei file."},
-                {"role": "user", "content": model_prompt}
-            ],
-            max_tokens=1000,
-            n=1,
-            temperature=0.7
-        )
-
-        new_names_text = response.choices[0].message.content.strip()
-        new_file_names = [name.strip() for name in new_names_text.split("\n") if name.strip()]
-        return new_file_names
-
-    def sanitize_filename(self, filename):
-        sanitized = re.sub(r'[<>:"/|?*]', '', filename)
-        sanitized = sanitized.replace(' ', '_')
-        return sanitized[:255]
+        return self.engine().get_ai_suggestion(prompt)
 
     def get_preview(self, directory, prompt):
         preview = "Anteprima delle modifiche:\n\n"
-        items = os.listdir(directory)
-        new_names = self.get_new_file_names(items[:5], prompt)
-        for old_name, new_name in zip(items[:5], new_names):
-            preview += f"{old_name} -> {self.sanitize_filename(new_name)}\n"
+        for old_name, new_name in self.engine().preview(directory, prompt):
+            preview += f"{old_name} -> {new_name}\n"
         preview += "\n... (e altri elementi)"
         return preview
 
@@ -0,0 +1,23 @@
+from .api import APIKeyManager
+from .engine import (MODE_FILES, MODE_FOLDERS, MODE_ALL, MODES, DEFAULT_MODEL, DEFAULT_RULES,
+                     RenameEngine, load_rules, sanitize_filename, select_items)
+from .provider import DEFAULT_PROVIDER, LOCAL_API_KEY, ModelProvider
+from .batching import TokenBudget, estimate_tokens, plan_chunks
+from .throttle import RateLimiter, call_with_retry
+from .cache import SuggestionCache
+from .rules import RuleSet, RuleViolation
+from .rule_store import DEFAULT_PROFILE, RuleStore
+from .walk import ParallelWalker, list_entries
+from .export import ViolationWriter
+from .progress import PHASE_NAMING, PHASE_RENAMING, Progress
+from .journal import RenameJournal, order_moves, plan_directory, resolve_targets, unique_name
+from .index import DirectoryIndex
+from .protocol import build_names_prompt, decode_names, encode_names, parse_names_response
+from .transforms import DEFAULT_TRANSFORMS, LocalTransforms
+from .dedup import fan_out, group_by_pattern, pattern_key
+from .metrics import (LATENCY_BUCKETS, MODEL_PRICES, STAGE_BATCH, STAGE_CHECK, STAGE_CONTENT, STAGE_LATENCY,
+                      STAGE_MODEL, STAGE_RENAME, STAGE_WALK, Histogram, Metrics)
+from .regex_guard import (RULE_CORPUS, RULE_TIME_BUDGET, GuardedMatcher, RuleTimeout, catastrophic_reason,
+                          extract_regex, validate_rule)
+from .content import MAX_FILE_BYTES, MAX_SNIPPET_CHARS, MAX_TOTAL_BYTES, ContentSampler
+from .watch import BATCH_SIZE, SETTLE_SECONDS, WINDOW_SECONDS, FolderWatcher, InotifySource, PollingSource
@@ -0,0 +1,48 @@
+import os
+
+
+class APIKeyManager:
+    def __init__(self, api_key_file='openai_api_key.txt', interactive=True):
+        self.api_key_file = api_key_file
+        # In modalità non interattiva (CLI, cron) non si apre mai una finestra Qt
+        self.interactive = interactive
+        self.api_key = None
+
+    def load_api_key(self):
+        if os.path.exists(self.api_key_file):
+            with open(self.api_key_file, 'r') as file:
+                self.api_key = file.read().strip()
+            return True
+        if os.environ.get('OPENAI_API_KEY'):
+            self.api_key = os.environ['OPENAI_API_KEY'].strip()
+            return True
+        return False
+
+    def save_api_key(self, api_key):
+        with open(self.api_key_file, 'w') as file:
+            file.write(api_key)
+        self.api_key = api_key
+
+    def get_api_key(self):
+        if not self.api_key:
+            if not self.load_api_key():
+                if not self.interactive:
+                    raise ValueError(f"API Key non trovata: crea {self.api_key_file} "
+                                     f"oppure imposta la variabile OPENAI_API_KEY.")
+                self.request_api_key()
+        return self.api_key
+
+    def request_api_key(self):
+        from PyQt5.QtWidgets import QInputDialog, QLineEdit
+
+        api_key, ok = QInputDialog.getText(
+            None,
+            "Inserisci API Key",
+            "Per favore, inserisci la tua API Key di OpenAI:",
+            QLineEdit.Normal
+        )
+        if ok and api_key:
+            self.save_api_key(api_key)
+        else:
+            raise ValueError("API Key non fornita. Impossibile procedere.")
+
@@ -0,0 +1,59 @@
+from .protocol import split_content_key
+
+
+# Stima approssimativa senza dipendenze: circa 4 caratteri per token
+CHARS_PER_TOKEN = 4
+# ID, virgolette e separatori JSON per ogni elemento
+ITEM_OVERHEAD_TOKENS = 5
+# I nuovi nomi possono essere più lunghi degli originali
+OUTPUT_GROWTH = 1.5
+
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+class TokenBudget:
+    def __init__(self, max_input_tokens=6000, max_output_tokens=1000, max_items=None):
+        self.max_input_tokens = max_input_tokens
+        self.max_output_tokens = max_output_tokens
+        self.max_items = max_items
+
+    def input_tokens(self, name):
+        return estimate_tokens(name) + ITEM_OVERHEAD_TOKENS
+
+    def output_tokens(self, name):
+        # L'eventuale estratto del contenuto pesa solo in ingresso
+        name, _ = split_content_key(name)
+        return int((estimate_tokens(name) + ITEM_OVERHEAD_TOKENS) * OUTPUT_GROWTH) + 1
+
+
+def plan_chunks(names, budget, base_tokens=0):
+    """Divide i nomi in blocchi ordinati che rientrano nel budget di token in ingresso e in uscita.
+
+    base_tokens è il costo fisso di ogni richiesta (prompt di sistema e istruzioni).
+    Un nome che da solo supera il budget finisce comunque in un blocco a sé.
+    """
+    chunks = []
+    current = []
+    input_tokens = base_tokens
+    output_tokens = 0
+
+    for name in names:
+        item_input = budget.input_tokens(name)
+        item_output = budget.output_tokens(name)
+        full = (input_tokens + item_input > budget.max_input_tokens
+                or output_tokens + item_output > budget.max_output_tokens
+                or (budget.max_items and len(current) >= budget.max_items))
+        if current and full:
+            chunks.append(current)
+            current = []
+            input_tokens = base_tokens
+            output_tokens = 0
+        current.append(name)
+        input_tokens += item_input
+        output_tokens += item_output
+
+    if current:
+        chunks.append(current)
+    return chunks
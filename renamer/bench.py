@@ -0,0 +1,280 @@
+"""Benchmark di controllo, anteprima, pianificazione e applicazione su alberi sintetici.
+
+Uso: python -m renamer.bench --sizes 10k,100k --output risultati.json
+Il modello è sostituito da FakeClient, quindi non servono né la rete né una API Key.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import types
+
+from .batching import estimate_tokens
+from .engine import MODES, MODE_ALL, RenameEngine
+from .protocol import decode_names
+
+
+SIZES = {'10k': 10000, '100k': 100000, '1m': 1000000}
+PHASES = ('check', 'preview', 'plan', 'apply')
+BENCH_PROMPT = "Rinomina in snake_case minuscolo, mantenendo l'estensione."
+
+WORDS = ('foto', 'Vacanza', 'report', 'Documento finale', 'dati-grezzi', 'Fattura', 'scansione',
+         'bozza', 'Relazione Tecnica', 'backup', 'Progetto', 'verbale riunione')
+EXTENSIONS = ('.jpg', '.JPG', '.pdf', '.docx', '.txt', '.csv', '.png', '')
+
+
+class FakeAPIError(Exception):
+    """Errore simulato con lo status HTTP, riconosciuto da call_with_retry come quelli di openai."""
+
+    def __init__(self, status_code, retry_after):
+        super().__init__(f"Errore simulato {status_code}")
+        self.status_code = status_code
+        self.response = types.SimpleNamespace(headers={'retry-after': str(retry_after)})
+
+
+class FakeClient:
+    """Sostituto locale del client OpenAI, con latenza e tasso di errore configurabili.
+
+    Risponde al protocollo JSON di build_names_prompt con nomi in snake_case; error_rate
+    è la probabilità che una chiamata fallisca con 429 o 500.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, retry_after=0.0, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+        self.chat = types.SimpleNamespace(completions=self)
+
+    def create(self, model, messages, max_tokens, **options):
+        with self.lock:
+            self.calls += 1
+            delay = max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+            failed = self.random.random() < self.error_rate
+            if failed:
+                self.errors += 1
+                status = self.random.choice((429, 500))
+        time.sleep(delay)
+        if failed:
+            raise FakeAPIError(status, self.retry_after)
+
+        content = messages[-1]['content']
+        encoded = next((line for line in content.splitlines() if line.startswith('{')), None)
+        if encoded is None:
+            text = 'nuovo_nome'
+        else:
+            names = decode_names(encoded)
+            text = json.dumps({'names': {i: fake_name(name) for i, name in names.items()}}, ensure_ascii=False)
+        usage = types.SimpleNamespace(
+            prompt_tokens=sum(estimate_tokens(message['content']) for message in messages),
+            completion_tokens=estimate_tokens(text))
+        usage.total_tokens = usage.prompt_tokens + usage.completion_tokens
+        message = types.SimpleNamespace(content=text)
+        return types.SimpleNamespace(choices=[types.SimpleNamespace(message=message, finish_reason='stop')],
+                                     usage=usage)
+
+
+def fake_name(name):
+    stem, extension = os.path.splitext(name)
+    stem = ''.join(c if c.isalnum() else '_' for c in stem.lower()).strip('_') or 'file'
+    return stem + extension.lower()
+
+
+def random_name(rng, index, is_dir):
+    word = rng.choice(WORDS)
+    style = rng.randrange(4)
+    if style == 0:
+        stem = f"{word} {index}"
+    elif style == 1:
+        stem = f"{word}_{index:05d}"
+    elif style == 2:
+        stem = f"IMG_{index:06d}"
+    else:
+        stem = f"{word} ({index})"
+    return stem if is_dir else stem + rng.choice(EXTENSIONS)
+
+
+def make_tree(root, entries, fanout=8, files_per_dir=40, seed=0):
+    """Crea sotto root un albero con circa entries elementi tra file e cartelle.
+
+    Il numero di sottocartelle e di file varia da cartella a cartella (fino a fanout e
+    a 2 * files_per_dir), così la profondità non è uniforme. Restituisce (cartelle, file).
+    """
+    rng = random.Random(seed)
+    queue = [root]
+    created_dirs = created_files = 0
+    index = 0
+    while queue and created_dirs + created_files < entries:
+        current = queue.pop(0)
+        for _ in range(rng.randint(0, 2 * files_per_dir)):
+            if created_dirs + created_files >= entries:
+                break
+            index += 1
+            open(os.path.join(current, random_name(rng, index, False)), 'w').close()
+            created_files += 1
+        subdirs = rng.randint(1 if not queue else 0, fanout)
+        for _ in range(subdirs):
+            if created_dirs + created_files >= entries:
+                break
+            index += 1
+            path = os.path.join(current, random_name(rng, index, True))
+            os.mkdir(path)
+            created_dirs += 1
+            queue.append(path)
+    return created_dirs, created_files
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+
+def phase_result(seconds, items, **extra):
+    return dict(seconds=round(seconds, 4), items=items,
+                per_second=round(items / seconds, 1) if seconds else None, **extra)
+
+
+def run_size(entries, args, client):
+    """Esegue le quattro fasi su un albero nuovo e restituisce i risultati di ciascuna."""
+    workdir = tempfile.mkdtemp(prefix='renamer-bench-', dir=args.workdir)
+    tree = os.path.join(workdir, 'albero')
+    os.mkdir(tree)
+    try:
+        (dirs, files), generate_seconds = timed(
+            lambda: make_tree(tree, entries, args.fanout, args.files_per_dir, args.seed))
+        engine = RenameEngine(client=client, mode=args.mode, concurrency=args.concurrency,
+                              max_retries=args.max_retries)
+        result = {'entries': dirs + files, 'dirs': dirs, 'files': files,
+                  'generate_seconds': round(generate_seconds, 4), 'phases': {}}
+        phases = result['phases']
+
+        ruleset = engine.compile_rules()
+        violations, seconds = timed(lambda: sum(1 for _ in engine.check_results(tree, ruleset)))
+        ruleset.close()
+        phases['check'] = phase_result(seconds, ruleset.checked, violations=violations)
+
+        calls = engine.progress.api_calls
+        proposal, seconds = timed(lambda: engine.preview(tree, BENCH_PROMPT, limit=args.preview_limit))
+        phases['preview'] = phase_result(seconds, len(proposal), api_calls=engine.progress.api_calls - calls)
+
+        calls = engine.progress.api_calls
+        moves, seconds = timed(lambda: engine.plan(tree, BENCH_PROMPT))
+        phases['plan'] = phase_result(seconds, engine.progress.total, moves=len(moves),
+                                      api_calls=engine.progress.api_calls - calls)
+
+        journal = engine.create_journal(tree, BENCH_PROMPT, moves, os.path.join(workdir, 'journal.jsonl'))
+        applied, seconds = timed(lambda: journal.apply(progress=engine.progress, metrics=engine.metrics))
+        phases['apply'] = phase_result(seconds, len(applied))
+        result['metrics'] = engine.metrics.summary()
+        return result
+    finally:
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def parse_sizes(text):
+    sizes = []
+    for part in text.split(','):
+        part = part.strip().lower()
+        if part in SIZES:
+            sizes.append((part, SIZES[part]))
+        elif part.isdigit():
+            sizes.append((part, int(part)))
+        else:
+            raise argparse.ArgumentTypeError(f"Dimensione non valida: {part} (usa 10k, 100k, 1m o un numero)")
+    return sizes
+
+
+def compare(results, baseline, tolerance):
+    """Restituisce le fasi più lente del riferimento oltre la tolleranza (0.2 = 20%)."""
+    regressions = []
+    for size, current in results['runs'].items():
+        previous = baseline.get('runs', {}).get(size)
+        if previous is None:
+            continue
+        for phase in PHASES:
+            old = previous['phases'].get(phase, {}).get('seconds')
+            new = current['phases'][phase]['seconds']
+            if old and new > old * (1 + tolerance):
+                regressions.append({'size': size, 'phase': phase, 'baseline': old, 'current': new,
+                                    'ratio': round(new / old, 2)})
+    return regressions
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='python -m renamer.bench',
+                                     description='Misura i tempi di controllo, anteprima, pianificazione e '
+                                                 'applicazione su alberi sintetici, senza chiamare OpenAI.')
+    parser.add_argument('--sizes', type=parse_sizes, default=parse_sizes('10k'),
+                        help='Dimensioni degli alberi separate da virgola: 10k, 100k, 1m o numeri (default: 10k)')
+    parser.add_argument('--fanout', type=int, default=8, help='Sottocartelle massime per cartella (default: 8)')
+    parser.add_argument('--files-per-dir', type=int, default=40, help='File medi per cartella (default: 40)')
+    parser.add_argument('--seed', type=int, default=0, help='Seme per alberi e risposte riproducibili (default: 0)')
+    parser.add_argument('--mode', choices=MODES, default=MODE_ALL, help='Elementi da considerare (default: all)')
+    parser.add_argument('--concurrency', type=int, default=4, help='Richieste in parallelo (default: 4)')
+    parser.add_argument('--max-retries', type=int, default=5, help='Tentativi sugli errori simulati (default: 5)')
+    parser.add_argument('--latency', type=float, default=0.0, help='Latenza simulata per chiamata in secondi')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Variazione casuale della latenza in secondi')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='Probabilità che una chiamata fallisca con 429 o 500 (es. 0.05)')
+    parser.add_argument('--retry-after', type=float, default=0.0,
+                        help='Attesa indicata negli errori simulati, in secondi (default: 0)')
+    parser.add_argument('--preview-limit', type=int, default=5, help='Elementi in anteprima (default: 5)')
+    parser.add_argument('--workdir', help='Cartella in cui creare gli alberi (default: cartella temporanea)')
+    parser.add_argument('--keep', action='store_true', help='Non cancellare gli alberi al termine')
+    parser.add_argument('--output', help='Salva i risultati in un file JSON (default: standard output)')
+    parser.add_argument('--baseline', help='Risultati JSON di una versione precedente da confrontare')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Rallentamento ammesso rispetto al riferimento (default: 0.2 = 20%%)')
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    client = FakeClient(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                        retry_after=args.retry_after, seed=args.seed)
+    results = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'settings': {'fanout': args.fanout, 'files_per_dir': args.files_per_dir, 'seed': args.seed,
+                     'mode': args.mode, 'concurrency': args.concurrency, 'latency': args.latency,
+                     'jitter': args.jitter, 'error_rate': args.error_rate},
+        'runs': {},
+    }
+    for label, entries in args.sizes:
+        print(f"Benchmark {label} ({entries} elementi)...", file=sys.stderr)
+        results['runs'][label] = run_size(entries, args, client)
+    results['fake_client'] = {'calls': client.calls, 'errors': client.errors}
+
+    status = 0
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            results['regressions'] = compare(results, json.load(f), args.tolerance)
+        for regression in results['regressions']:
+            print(f"Regressione {regression['size']}/{regression['phase']}: {regression['baseline']} s -> "
+                  f"{regression['current']} s (x{regression['ratio']})", file=sys.stderr)
+        status = 1 if results['regressions'] else 0
+
+    text = json.dumps(results, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
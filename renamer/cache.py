@@ -0,0 +1,91 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+
+class SuggestionCache:
+    """Cache su disco dei nomi suggeriti dal modello.
+
+    La chiave è (modello, prompt di sistema, prompt utente, nome originale), così
+    Anteprima e Rinomina ottengono lo stesso risultato e una ripresa dopo un crash
+    o una modifica del prompt paga solo i nomi davvero nuovi.
+    """
+
+    def __init__(self, path='suggestions.sqlite', max_entries=200000, max_age_days=90):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age = max_age_days * 86400 if max_age_days else None
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS suggestions ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, used REAL NOT NULL)"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS suggestions_used ON suggestions (used)")
+        self.evict()
+
+    @staticmethod
+    def make_key(model, system_prompt, prompt, name):
+        payload = json.dumps([model, system_prompt, prompt, name], ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get_many(self, model, system_prompt, prompt, names):
+        keys = {self.make_key(model, system_prompt, prompt, name): name for name in names}
+        found = {}
+        now = time.time()
+        with self.lock:
+            key_list = list(keys)
+            # SQLite limita il numero di parametri per query
+            for start in range(0, len(key_list), 500):
+                batch = key_list[start:start + 500]
+                placeholders = ','.join('?' * len(batch))
+                rows = self.connection.execute(
+                    f"SELECT key, value, created FROM suggestions WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, value, created in rows:
+                    if self.max_age is None or now - created <= self.max_age:
+                        found[keys[key]] = value
+                self.connection.executemany("UPDATE suggestions SET used = ? WHERE key = ?",
+                                            [(now, key) for key, _, _ in rows])
+            self.connection.commit()
+            self.hits += len(found)
+            self.misses += len(set(names)) - len(found)
+        return found
+
+    def put_many(self, model, system_prompt, prompt, suggestions):
+        now = time.time()
+        rows = [(self.make_key(model, system_prompt, prompt, name), value, now, now)
+                for name, value in suggestions.items()]
+        with self.lock:
+            self.connection.executemany("INSERT OR REPLACE INTO suggestions VALUES (?, ?, ?, ?)", rows)
+            self.connection.commit()
+
+    def evict(self):
+        with self.lock:
+            if self.max_age is not None:
+                self.connection.execute("DELETE FROM suggestions WHERE created < ?", (time.time() - self.max_age,))
+            if self.max_entries:
+                self.connection.execute(
+                    "DELETE FROM suggestions WHERE key IN ("
+                    "SELECT key FROM suggestions ORDER BY used DESC LIMIT -1 OFFSET ?)", (self.max_entries,)
+                )
+            self.connection.commit()
+
+    def clear(self):
+        with self.lock:
+            self.connection.execute("DELETE FROM suggestions")
+            self.connection.commit()
+
+    def stats(self):
+        with self.lock:
+            entries = self.connection.execute("SELECT COUNT(*) FROM suggestions").fetchone()[0]
+        return {'hits': self.hits, 'misses': self.misses, 'entries': entries}
+
+    def close(self):
+        self.evict()
+        with self.lock:
+            self.connection.close()
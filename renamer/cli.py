@@ -0,0 +1,345 @@
+import argparse
+import os
+import sys
+import time
+
+from .api import APIKeyManager
+from .batching import TokenBudget
+from .cache import SuggestionCache
+from .content import MAX_FILE_BYTES, MAX_TOTAL_BYTES, ContentSampler
+from .engine import MODES, MODE_ALL, DEFAULT_MODEL, DEFAULT_RULES, RenameEngine
+from .export import ViolationWriter
+from .index import DirectoryIndex
+from .metrics import Metrics
+from .provider import DEFAULT_PROVIDER, ModelProvider
+from .regex_guard import RULE_TIME_BUDGET
+from .rule_store import RuleStore
+from .throttle import RateLimiter
+from .transforms import LocalTransforms
+from .walk import ParallelWalker
+from .watch import BATCH_SIZE, POLL_INTERVAL, SETTLE_SECONDS, WINDOW_SECONDS, FolderWatcher
+
+
+def read_prompt(args):
+    if args.prompt_file:
+        with open(args.prompt_file, 'r', encoding='utf-8') as f:
+            return f.read().strip()
+    return args.prompt
+
+
+def build_engine(args):
+    api_manager = APIKeyManager(api_key_file=args.api_key_file, interactive=False)
+    provider = ModelProvider.load(args.provider_config, api_manager, model=args.model, base_url=args.base_url,
+                                  timeout=args.timeout, pool_size=args.pool_size)
+    budget = TokenBudget(max_input_tokens=args.max_input_tokens, max_output_tokens=args.max_output_tokens,
+                         max_items=args.max_batch_items)
+    limiter = RateLimiter(requests_per_minute=args.rpm, tokens_per_minute=args.tpm) if args.rpm or args.tpm else None
+    rule_store = RuleStore(args.rules, DEFAULT_RULES, time_budget=args.rule_timeout)
+    return RenameEngine(provider=provider, mode=args.mode,
+                        rule_store=rule_store, rule_profile=args.profile, budget=budget,
+                        concurrency=args.concurrency, limiter=limiter, max_retries=args.max_retries,
+                        item_retries=args.item_retries, json_mode=not args.no_json_mode,
+                        pattern_dedup=args.pattern_dedup, metrics=Metrics(),
+                        rule_time_budget=args.rule_timeout,
+                        walker=ParallelWalker(workers=args.walk_workers, max_depth=args.max_depth,
+                                              include=args.include, exclude=args.exclude),
+                        content=ContentSampler(max_file_bytes=args.content_bytes, max_total_bytes=args.content_memory,
+                                               workers=args.content_workers) if args.content else None,
+                        cache=SuggestionCache(args.cache_file) if args.uses_model and not args.no_cache else None,
+                        index=DirectoryIndex(args.index) if args.index else None,
+                        transforms=LocalTransforms.load(args.transforms) if args.local_pass else None)
+
+
+def cmd_scan(engine, args):
+    for path in engine.scan(args.directory):
+        print(path)
+    return 0
+
+
+def cmd_check(engine, args):
+    ruleset = engine.compile_rules()
+    start = time.perf_counter()
+    found = 0
+    writer = ViolationWriter(args.export) if args.export else None
+    try:
+        for violation in engine.check_results(args.directory, ruleset):
+            print(f"{violation.path}\t{violation.reason}")
+            if writer:
+                writer.write(violation)
+            found += 1
+    finally:
+        if writer:
+            writer.close()
+        ruleset.close()
+    for message in ruleset.warnings():
+        print(message, file=sys.stderr)
+    if args.stats:
+        elapsed = time.perf_counter() - start
+        rate = ruleset.checked / elapsed if elapsed else 0
+        print(f"Controllati {ruleset.checked} nomi in {elapsed:.2f} s ({rate:.0f} nomi/s)", file=sys.stderr)
+    return 1 if found else 0
+
+
+def cmd_preview(engine, args):
+    for old_name, new_name in engine.preview(args.directory, read_prompt(args), limit=args.limit):
+        print(f"{old_name} -> {new_name}")
+    return 0
+
+
+def print_moves(moves):
+    for old_path, new_path in moves:
+        print(f"{old_path} -> {new_path}")
+
+
+def cmd_plan(engine, args):
+    prompt = read_prompt(args)
+    moves = engine.plan(args.directory, prompt)
+    journal = engine.create_journal(args.directory, prompt, moves, args.journal)
+    print_moves((os.path.join(root, src), os.path.join(root, dst)) for root, src, dst in moves)
+    print(f"Piano salvato in {journal.path} ({len(moves)} spostamenti)", file=sys.stderr)
+    return 0
+
+
+def cmd_rename(engine, args):
+    print_moves(engine.rename(args.directory, read_prompt(args), journal_path=args.journal))
+    if engine.last_journal:
+        print(f"Journal: {engine.last_journal.path}", file=sys.stderr)
+    return 0
+
+
+def cmd_apply(engine, args):
+    print_moves(engine.apply_journal(args.journal))
+    return 0
+
+
+def cmd_undo(engine, args):
+    print_moves(engine.undo_journal(args.journal))
+    return 0
+
+
+def cmd_watch(engine, args):
+    def on_batch(stats, applied):
+        print_moves(applied)
+        line = (f"Gruppo {stats['batch']}: {stats['files']} file, {stats['renamed']} rinominati in "
+                f"{stats['seconds']:.2f} s; attesa media {stats['latency_avg']:.1f} s, massima "
+                f"{stats['latency_max']:.1f} s")
+        if stats['error']:
+            line += f" - errore: {stats['error']}"
+        print(line, file=sys.stderr, flush=True)
+        try:
+            # Con un processo che non termina le metriche vanno aggiornate a ogni gruppo
+            if args.metrics_json:
+                engine.metrics.write_json(args.metrics_json)
+            if args.prometheus_textfile:
+                engine.metrics.write_prometheus(args.prometheus_textfile)
+        except OSError as e:
+            print(f"Errore nel salvataggio delle metriche: {e}", file=sys.stderr)
+
+    def on_error(message):
+        print(message, file=sys.stderr)
+
+    watcher = FolderWatcher(engine, args.directories, read_prompt(args), window=args.window,
+                            batch_size=args.batch_size, settle=args.settle, polling=args.polling,
+                            poll_interval=args.poll_interval, journal_dir=args.journal_dir, on_batch=on_batch,
+                            on_error=on_error)
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def cmd_profiles(engine, args):
+    store = engine.rule_store
+    for name in store.profile_names():
+        marker = '*' if name == store.active else ' '
+        print(f"{marker} {name} ({len(store.rules(name))} regole)")
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='python -m renamer',
+                                     description='Rinomina file e cartelle con l\'AI, senza interfaccia grafica.')
+    parser.add_argument('--mode', choices=MODES, default=MODE_ALL,
+                        help='Elementi da considerare (default: all)')
+    parser.add_argument('--rules', default='rules.json', help='File JSON con le regole (default: rules.json)')
+    parser.add_argument('--profile',
+                        help='Profilo di regole da usare (default: il profilo attivo nel file delle regole)')
+    parser.add_argument('--model',
+                        help=f'Modello da usare (default: quello di provider.json, altrimenti {DEFAULT_MODEL})')
+    parser.add_argument('--base-url',
+                        help='Server compatibile con le API OpenAI, ad esempio un server locale llama.cpp o vLLM '
+                             '(http://localhost:8080/v1); non richiede la API Key')
+    parser.add_argument('--timeout', type=float,
+                        help='Secondi massimi per una richiesta al modello '
+                             f'(default: {DEFAULT_PROVIDER["timeout"]})')
+    parser.add_argument('--pool-size', type=int,
+                        help='Connessioni HTTP mantenute aperte e riusate tra le richieste '
+                             f'(default: {DEFAULT_PROVIDER["pool_size"]})')
+    parser.add_argument('--provider-config', default='provider.json',
+                        help='File JSON con model, base_url, timeout, connect_timeout e pool_size '
+                             '(default: provider.json, se esiste)')
+    parser.add_argument('--api-key-file', default='openai_api_key.txt',
+                        help='File con la API Key di OpenAI (in alternativa OPENAI_API_KEY)')
+    parser.add_argument('--max-input-tokens', type=int, default=6000,
+                        help='Token massimi in ingresso per richiesta (default: 6000)')
+    parser.add_argument('--max-output-tokens', type=int, default=1000,
+                        help='Token massimi in uscita per richiesta (default: 1000)')
+    parser.add_argument('--max-batch-items', type=int, default=None,
+                        help='Numero massimo di nomi per richiesta (default: nessun limite)')
+    parser.add_argument('--concurrency', type=int, default=4, help='Richieste al modello in parallelo (default: 4)')
+    parser.add_argument('--rpm', type=int, default=None, help='Limite di richieste al minuto')
+    parser.add_argument('--tpm', type=int, default=None, help='Limite di token al minuto')
+    parser.add_argument('--max-retries', type=int, default=5,
+                        help='Tentativi in caso di errori 429/5xx, con backoff esponenziale (default: 5)')
+    parser.add_argument('--item-retries', type=int, default=2,
+                        help='Nuove richieste per i soli elementi senza un nome valido (default: 2)')
+    parser.add_argument('--no-json-mode', action='store_true',
+                        help='Non richiedere response_format JSON (per server che non lo supportano)')
+    parser.add_argument('--pattern-dedup', action='store_true',
+                        help='Chiede una sola volta i nomi che differiscono solo per i numeri (IMG_0001, IMG_0002) '
+                             'ed estende il risultato agli altri')
+    parser.add_argument('--cache-file', default='suggestions.sqlite',
+                        help='Cache dei nomi suggeriti (default: suggestions.sqlite)')
+    parser.add_argument('--no-cache', action='store_true', help='Ignora la cache e interroga sempre il modello')
+    parser.add_argument('--local-pass', action='store_true',
+                        help='Applica prima le trasformazioni locali; i nomi che poi rispettano le regole '
+                             'non vengono inviati al modello')
+    parser.add_argument('--transforms', default='transforms.json',
+                        help='Configurazione delle trasformazioni locali (default: transforms.json)')
+    parser.add_argument('--content', action='store_true',
+                        help='Include nella richiesta un breve estratto del contenuto dei file (testo iniziale, '
+                             'titolo e data di PDF e documenti Office, data di scatto EXIF)')
+    parser.add_argument('--content-bytes', type=int, default=MAX_FILE_BYTES,
+                        help=f'Byte letti al massimo da ogni file (default: {MAX_FILE_BYTES})')
+    parser.add_argument('--content-memory', type=int, default=MAX_TOTAL_BYTES,
+                        help=f'Byte in lettura al massimo contemporaneamente (default: {MAX_TOTAL_BYTES})')
+    parser.add_argument('--content-workers', type=int, default=8,
+                        help='Thread per la lettura dei contenuti (default: 8)')
+    parser.add_argument('--index', help='Indice persistente per le esecuzioni incrementali (es. scan-index.sqlite): '
+                                        'le cartelle invariate non vengono rilette e gli elementi già '
+                                        'rinominati con lo stesso prompt vengono saltati')
+    parser.add_argument('--walk-workers', type=int, default=8,
+                        help='Cartelle lette in parallelo, utile sulle condivisioni di rete (default: 8)')
+    parser.add_argument('--max-depth', type=int, default=None,
+                        help='Livelli di sottocartelle da visitare (0: solo la cartella indicata; default: tutti)')
+    parser.add_argument('--include', action='append', metavar='PATTERN',
+                        help='Considera solo i file che corrispondono al pattern glob (ripetibile, es. "*.pdf")')
+    parser.add_argument('--exclude', action='append', metavar='PATTERN',
+                        help='Ignora file e cartelle che corrispondono al pattern glob, senza entrare nelle '
+                             'cartelle escluse (ripetibile, es. ".git")')
+    parser.add_argument('--rule-timeout', type=float, default=RULE_TIME_BUDGET,
+                        help=f'Secondi massimi per valutare una regola su un nome (default: {RULE_TIME_BUDGET}); '
+                             'le regole che li superano vengono sospese e segnalate')
+    parser.add_argument('--metrics-json', help='Al termine salva in questo file il riepilogo JSON di tempi, '
+                                               'token e costo stimato')
+    parser.add_argument('--prometheus-textfile',
+                        help='Al termine scrive le metriche in formato Prometheus (es. per il textfile '
+                             'collector di node_exporter)')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    scan = subparsers.add_parser('scan', help='Elenca gli elementi che verrebbero considerati')
+    scan.set_defaults(func=cmd_scan, uses_model=False)
+
+    check = subparsers.add_parser('check', help='Evidenzia i nomi che non rispettano le regole')
+    check.add_argument('--export', help='Salva le violazioni in un file .csv o .jsonl')
+    check.add_argument('--stats', action='store_true', help='Mostra il numero di nomi controllati al secondo')
+    check.set_defaults(func=cmd_check, uses_model=False)
+
+    preview = subparsers.add_parser('preview', help='Mostra un\'anteprima delle modifiche')
+    preview.add_argument('--limit', type=int, default=5, help='Numero di elementi in anteprima (default: 5)')
+    preview.set_defaults(func=cmd_preview, uses_model=True)
+
+    plan = subparsers.add_parser('plan', help='Calcola le rinomine e le salva in un journal senza applicarle')
+    plan.set_defaults(func=cmd_plan, uses_model=True)
+
+    rename = subparsers.add_parser('rename', help='Rinomina gli elementi (piano + applicazione)')
+    rename.set_defaults(func=cmd_rename, uses_model=True)
+
+    apply = subparsers.add_parser('apply', help='Applica un journal, riprendendo da dove si era fermato')
+    apply.set_defaults(func=cmd_apply, uses_model=False)
+
+    undo = subparsers.add_parser('undo', help='Annulla le rinomine registrate in un journal')
+    undo.set_defaults(func=cmd_undo, uses_model=False)
+
+    watch = subparsers.add_parser('watch', help='Osserva le cartelle e rinomina i file nuovi a gruppi (Ctrl+C per '
+                                                 'terminare)')
+    watch.add_argument('directories', nargs='+', metavar='directory', help='Cartelle da osservare')
+    watch.add_argument('--window', type=float, default=WINDOW_SECONDS,
+                       help=f'Secondi di attesa dal primo file pronto prima di rinominare il gruppo '
+                            f'(default: {WINDOW_SECONDS})')
+    watch.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                       help=f'Il gruppo parte subito quando raggiunge questo numero di file (default: {BATCH_SIZE})')
+    watch.add_argument('--settle', type=float, default=SETTLE_SECONDS,
+                       help=f'Secondi senza modifiche dopo i quali un file è considerato completo '
+                            f'(default: {SETTLE_SECONDS})')
+    watch.add_argument('--polling', action='store_true',
+                       help='Controlla periodicamente le cartelle invece di usare inotify (ad esempio su '
+                            'condivisioni di rete)')
+    watch.add_argument('--poll-interval', type=float, default=POLL_INTERVAL,
+                       help=f'Secondi tra due controlli in modalità polling (default: {POLL_INTERVAL})')
+    watch.add_argument('--journal-dir', default='.', help='Cartella dei journal, uno per gruppo (default: .)')
+    watch.set_defaults(func=cmd_watch, uses_model=True)
+
+    profiles = subparsers.add_parser('profiles', help='Elenca i profili di regole (* = attivo)')
+    profiles.set_defaults(func=cmd_profiles, uses_model=False)
+
+    for subparser in (scan, check, preview, plan, rename):
+        subparser.add_argument('directory', help='Cartella da elaborare')
+    for subparser in (preview, plan, rename, watch):
+        group = subparser.add_mutually_exclusive_group(required=True)
+        group.add_argument('--prompt', help='Prompt per rinominare')
+        group.add_argument('--prompt-file', help='File contenente il prompt')
+    for subparser in (plan, rename):
+        subparser.add_argument('--journal', help='File del journal (default: rename-journal-<data>.jsonl)')
+    for subparser in (apply, undo):
+        subparser.add_argument('journal', help='File del journal')
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        engine = build_engine(args)
+    except (ValueError, OSError) as e:
+        print(f"Errore: {e}", file=sys.stderr)
+        return 2
+    try:
+        return args.func(engine, args)
+    except (ValueError, OSError, ImportError) as e:
+        print(f"Errore: {e}", file=sys.stderr)
+        return 2
+    finally:
+        if engine.cache is not None:
+            stats = engine.cache.stats()
+            if stats['hits'] or stats['misses']:
+                print(f"Cache: {stats['hits']} trovati, {stats['misses']} mancanti, "
+                      f"{stats['entries']} voci", file=sys.stderr)
+            engine.cache.close()
+        savings = engine.token_savings()
+        if savings['names']:
+            print(f"Nomi: {savings['names']}, inviati al modello: {savings['names_sent']}; token in ingresso "
+                  f"stimati: {savings['input_tokens_sent']} invece di {savings['input_tokens_baseline']} "
+                  f"(risparmiati {savings['input_tokens_saved']})", file=sys.stderr)
+        if engine.metrics.requests:
+            print(engine.metrics.describe(), file=sys.stderr)
+        try:
+            if args.metrics_json:
+                engine.metrics.write_json(args.metrics_json)
+            if args.prometheus_textfile:
+                engine.metrics.write_prometheus(args.prometheus_textfile)
+        except OSError as e:
+            print(f"Errore nel salvataggio delle metriche: {e}", file=sys.stderr)
+        if engine.content is not None:
+            stats = engine.content.stats()
+            if stats['sampled']:
+                print(f"Contenuti letti: {stats['sampled']} file, {stats['bytes_read'] // 1024} KB", file=sys.stderr)
+        if engine.transforms is not None and engine.transforms.resolved:
+            print(f"Risolti localmente senza AI: {engine.transforms.resolved}", file=sys.stderr)
+        if engine.index is not None:
+            stats = engine.index.stats()
+            print(f"Indice: {stats['dirs_listed']} cartelle lette, {stats['dirs_reused']} riusate, "
+                  f"{stats['results_reused']} risultati riusati", file=sys.stderr)
+            engine.index.close()
+        engine.provider.close()
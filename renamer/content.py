@@ -0,0 +1,264 @@
+import html
+import mmap
+import os
+import re
+import struct
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from .metrics import STAGE_CONTENT
+
+
+# Byte letti al massimo da ogni file e, in totale, da tutti i thread nello stesso momento
+MAX_FILE_BYTES = 16 * 1024
+MAX_TOTAL_BYTES = 64 * 1024 * 1024
+# Lunghezza massima dell'estratto inviato al modello per ogni file
+MAX_SNIPPET_CHARS = 200
+
+TEXT_EXTENSIONS = {'.txt', '.md', '.csv', '.tsv', '.json', '.xml', '.html', '.htm', '.log', '.ini', '.cfg',
+                   '.yaml', '.yml', '.py', '.js', '.sql', '.tex', '.rtf', '.srt'}
+EXIF_EXTENSIONS = {'.jpg', '.jpeg', '.tif', '.tiff', '.heic', '.cr2', '.nef', '.arw', '.dng', '.orf', '.rw2'}
+OFFICE_EXTENSIONS = {'.docx', '.xlsx', '.pptx', '.odt', '.ods', '.odp'}
+
+# Le date EXIF sono testo ASCII nel formato AAAA:MM:GG hh:mm:ss, nelle prime decine di KB del file
+EXIF_DATE = re.compile(rb'((?:19|20)\d{2}):([01]\d):([0-3]\d) [0-2]\d:[0-5]\d:[0-5]\d')
+PDF_FIELD = re.compile(rb'/(Title|Author|Subject|CreationDate)\s*(\((?:[^()\\]|\\.)*\)|<[0-9A-Fa-f\s]*>)')
+PDF_DATE = re.compile(r'D:(\d{4})(\d{2})?(\d{2})?')
+PDF_ESCAPES = re.compile(rb'\\([nrtbf()\\]|[0-7]{1,3})')
+HTML_TITLE = re.compile(r'<title[^>]*>(.*?)</title>', re.I | re.S)
+XML_FIELD = re.compile(r'<(dc:title|dc:creator|dc:subject|dcterms:created|meta:creation-date)\b[^>]*>(.*?)</\1>',
+                       re.S)
+TAGS = re.compile(r'<[^>]+>')
+CONTROL = re.compile(r'[\x00-\x1f\x7f]+')
+WHITESPACE = re.compile(r'\s+')
+
+# Record di fine della directory centrale di uno zip (senza commento finale)
+ZIP_END_RECORD = struct.Struct('<4s4H2LH')
+ZIP_END_SIGNATURE = b'PK\x05\x06'
+# Intestazione locale che precede ogni elemento dello zip, senza nome e campi extra
+ZIP_LOCAL_HEADER_SIZE = 30
+
+PDF_LABELS = {b'Title': 'titolo', b'Author': 'autore', b'Subject': 'oggetto', b'CreationDate': 'data'}
+XML_LABELS = {'dc:title': 'titolo', 'dc:creator': 'autore', 'dc:subject': 'oggetto',
+              'dcterms:created': 'data', 'meta:creation-date': 'data'}
+
+
+class MemoryBudget:
+    """Limite ai byte che i thread possono avere in lettura contemporaneamente."""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.available = limit
+        self.condition = threading.Condition()
+
+    @contextmanager
+    def reserve(self, amount):
+        amount = min(amount, self.limit)
+        with self.condition:
+            while self.available < amount:
+                self.condition.wait()
+            self.available -= amount
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.available += amount
+                self.condition.notify_all()
+
+
+class CountingReader:
+    """File aperto in lettura che conta i byte effettivamente letti."""
+
+    def __init__(self, f):
+        self.f = f
+        self.count = 0
+
+    def read(self, size=-1):
+        data = self.f.read(size)
+        self.count += len(data)
+        return data
+
+    def __getattr__(self, name):
+        return getattr(self.f, name)
+
+
+def clean(text):
+    return WHITESPACE.sub(' ', CONTROL.sub(' ', text)).strip()
+
+
+def pdf_string(raw):
+    if raw.startswith(b'<'):
+        data = bytes.fromhex(re.sub(rb'\s', b'', raw[1:-1]).decode('ascii'))
+    else:
+        escapes = {b'n': b'\n', b'r': b'\r', b't': b'\t', b'b': b'', b'f': b''}
+        data = PDF_ESCAPES.sub(lambda m: escapes.get(m.group(1), m.group(1)) if not m.group(1).isdigit()
+                               else bytes([int(m.group(1), 8) & 0xff]), raw[1:-1])
+    if data.startswith(b'\xfe\xff'):
+        return data[2:].decode('utf-16-be', errors='replace')
+    return data.decode('latin-1')
+
+
+def date_text(year, month=None, day=None):
+    return '-'.join(part for part in (year, month, day) if part)
+
+
+class ContentSampler:
+    """Estrae un breve riassunto del contenuto dei file da includere nella richiesta dei nomi.
+
+    Testo iniziale per i file di testo, titolo, autore e data per PDF e documenti Office,
+    data di scatto EXIF per le foto. Da ogni file si leggono al massimo max_file_bytes
+    (con letture limitate o finestre di un mmap, mai il file intero) e tutti i thread
+    insieme non superano max_total_bytes. Gli altri formati, come video e archivi, non
+    vengono aperti.
+
+    Ogni estrattore restituisce (estratto, byte letti): stats() conta i byte davvero letti.
+    """
+
+    def __init__(self, max_file_bytes=MAX_FILE_BYTES, max_total_bytes=MAX_TOTAL_BYTES, workers=8,
+                 max_chars=MAX_SNIPPET_CHARS):
+        self.max_file_bytes = max_file_bytes
+        self.budget = MemoryBudget(max_total_bytes)
+        self.workers = workers
+        self.max_chars = max_chars
+        self.lock = threading.Lock()
+        self.sampled = 0
+        self.bytes_read = 0
+
+    def extractor(self, extension):
+        if extension in TEXT_EXTENSIONS:
+            return self.read_text
+        if extension == '.pdf':
+            return self.read_pdf
+        if extension in EXIF_EXTENSIONS:
+            return self.read_exif
+        if extension in OFFICE_EXTENSIONS:
+            return self.read_office
+        return None
+
+    def sample(self, path):
+        """Restituisce l'estratto del file, oppure '' se il formato non è gestito o non contiene nulla di utile."""
+        extractor = self.extractor(os.path.splitext(path)[1].lower())
+        if extractor is None:
+            return ''
+        try:
+            size = os.path.getsize(path)
+            if size == 0:
+                return ''
+            amount = min(size, self.max_file_bytes)
+            with self.budget.reserve(amount):
+                snippet, read = extractor(path, size)
+        except (OSError, ValueError, zipfile.BadZipFile):
+            return ''
+        with self.lock:
+            self.sampled += 1
+            self.bytes_read += read
+        return clean(snippet)[:self.max_chars]
+
+    def sample_many(self, paths, metrics=None):
+        """Restituisce {percorso: estratto} leggendo i file in parallelo."""
+        def timed_sample(path):
+            if metrics is None:
+                return self.sample(path)
+            with metrics.timer(STAGE_CONTENT):
+                return self.sample(path)
+
+        if not paths:
+            return {}
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            return dict(zip(paths, executor.map(timed_sample, paths)))
+
+    def windows(self, path, size, tail=True):
+        """Inizio (e con tail anche fine) del file tramite mmap, senza superare max_file_bytes in totale."""
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            if size <= self.max_file_bytes:
+                return [mapped[:]]
+            if not tail:
+                return [mapped[:self.max_file_bytes]]
+            half = self.max_file_bytes // 2
+            return [mapped[:half], mapped[size - half:]]
+
+    def read_text(self, path, size):
+        with open(path, 'rb') as f:
+            data = f.read(self.max_file_bytes)
+        text = data.decode('utf-8', errors='replace')
+        title = HTML_TITLE.search(text)
+        if title:
+            return f"titolo: {html.unescape(title.group(1))}", len(data)
+        if os.path.splitext(path)[1].lower() in ('.html', '.htm', '.xml'):
+            text = html.unescape(TAGS.sub(' ', text))
+        return f"testo: {text}", len(data)
+
+    def read_pdf(self, path, size):
+        # Il dizionario Info sta di solito all'inizio (PDF linearizzati) o in fondo, vicino al trailer
+        fields = {}
+        windows = self.windows(path, size)
+        for window in windows:
+            for key, raw in PDF_FIELD.findall(window):
+                fields.setdefault(key, pdf_string(raw))
+        parts = []
+        for key in (b'Title', b'Author', b'Subject', b'CreationDate'):
+            value = clean(fields.get(key, ''))
+            if key == b'CreationDate':
+                match = PDF_DATE.search(value)
+                value = date_text(*match.groups()) if match else ''
+            if value:
+                parts.append(f"{PDF_LABELS[key]}: {value}")
+        return '; '.join(parts), sum(len(window) for window in windows)
+
+    def read_exif(self, path, size):
+        head = self.windows(path, size, tail=False)[0]
+        match = EXIF_DATE.search(head)
+        if not match:
+            return '', len(head)
+        return f"data di scatto: {date_text(*(part.decode() for part in match.groups()))}", len(head)
+
+    def central_directory_size(self, f, size):
+        """Dimensione della directory centrale dello zip, letta dal record finale; None se non si può usare.
+
+        zipfile legge tutta la directory centrale all'apertura: va controllata prima. Gli
+        zip con un commento finale o in formato ZIP64 (i documenti Office non li usano)
+        non vengono aperti, perché zipfile ne leggerebbe la coda o i record estesi.
+        """
+        if size < ZIP_END_RECORD.size:
+            return None
+        f.seek(size - ZIP_END_RECORD.size)
+        signature, disk, start_disk, entries, total, directory_size, offset, comment = \
+            ZIP_END_RECORD.unpack(f.read(ZIP_END_RECORD.size))
+        if signature != ZIP_END_SIGNATURE or comment or 0xFFFF in (entries, total) or 0xFFFFFFFF in (
+                directory_size, offset):
+            return None
+        return directory_size
+
+    def read_office(self, path, size):
+        with open(path, 'rb') as raw:
+            f = CountingReader(raw)
+            directory_size = self.central_directory_size(f, size)
+            # Directory centrale e metadati devono stare insieme in max_file_bytes
+            if directory_size is None or directory_size > self.max_file_bytes - f.count:
+                return '', f.count
+            with zipfile.ZipFile(f) as archive:
+                names = set(archive.namelist())
+                for member in ('docProps/core.xml', 'meta.xml'):
+                    if member not in names:
+                        continue
+                    info = archive.getinfo(member)
+                    stored = ZIP_LOCAL_HEADER_SIZE + len(info.orig_filename.encode()) + len(info.extra) + \
+                        info.compress_size
+                    if info.file_size > self.max_file_bytes or stored > self.max_file_bytes - f.count:
+                        continue
+                    text = archive.read(member).decode('utf-8', errors='replace')
+                    parts = []
+                    for tag, value in XML_FIELD.findall(text):
+                        value = clean(html.unescape(value))
+                        if tag in ('dcterms:created', 'meta:creation-date'):
+                            value = value[:10]
+                        if value:
+                            parts.append(f"{XML_LABELS[tag]}: {value}")
+                    return '; '.join(parts), f.count
+            return '', f.count
+
+    def stats(self):
+        with self.lock:
+            return {'sampled': self.sampled, 'bytes_read': self.bytes_read}
@@ -0,0 +1,56 @@
+import re
+
+
+DIGITS = re.compile(r'\d+')
+
+
+def pattern_key(name):
+    """Nomi che differiscono solo per i numeri (IMG_0001.jpg, IMG_0002.jpg) hanno la stessa chiave."""
+    return DIGITS.sub('#', name)
+
+
+def group_by_pattern(names):
+    """Restituisce {rappresentante: [altri nomi con lo stesso schema]}, nell'ordine di prima apparizione.
+
+    I nomi senza cifre rappresentano solo sé stessi.
+    """
+    groups = {}
+    representatives = {}
+    for name in names:
+        if not DIGITS.search(name):
+            groups[name] = []
+            continue
+        key = pattern_key(name)
+        if key in representatives:
+            groups[representatives[key]].append(name)
+        else:
+            representatives[key] = name
+            groups[name] = []
+    return groups
+
+
+def fan_out(representative, new_name, member):
+    """Applica a member la rinomina del rappresentante sostituendo i suoi numeri.
+
+    Ogni numero del rappresentante deve comparire una sola volta nel nuovo nome e
+    nello stesso ordine, e un numero ripetuto nel rappresentante (a1b1.jpg) non si può
+    attribuire; altrimenti restituisce None e member va chiesto al modello.
+    """
+    old_numbers = DIGITS.findall(representative)
+    member_numbers = DIGITS.findall(member)
+    if len(old_numbers) != len(member_numbers):
+        return None
+    runs = list(DIGITS.finditer(new_name))
+    values = [run.group(0) for run in runs]
+    if any(values.count(number) != 1 for number in old_numbers):
+        return None
+    positions = [values.index(number) for number in old_numbers]
+    if positions != sorted(set(positions)):
+        return None
+
+    result = new_name
+    # Sostituzione da destra per non spostare gli indici delle corrispondenze precedenti
+    for position, number in sorted(zip(positions, member_numbers), reverse=True):
+        run = runs[position]
+        result = result[:run.start()] + number + result[run.end():]
+    return result
@@ -0,0 +1,530 @@
+import os
+import re
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from .batching import TokenBudget, estimate_tokens, plan_chunks
+from .dedup import fan_out, group_by_pattern
+from .index import fingerprint
+from .metrics import STAGE_CHECK, STAGE_MODEL, STAGE_WALK, Metrics
+from .journal import RenameJournal, default_journal_path, order_moves, resolve_targets
+from .progress import PHASE_NAMING, Progress
+from .provider import DEFAULT_MODEL, ModelProvider
+from .protocol import (CONTENT_SEPARATOR, build_names_prompt, content_key, parse_names_response,
+                       split_content_key)
+from .regex_guard import RULE_TIME_BUDGET
+from .rule_store import RuleStore
+from .rules import RuleSet
+from .throttle import call_with_retry
+from .walk import ParallelWalker, list_entries
+
+
+MODE_FILES = 'files'
+MODE_FOLDERS = 'folders'
+MODE_ALL = 'all'
+MODES = (MODE_FILES, MODE_FOLDERS, MODE_ALL)
+
+SYSTEM_PROMPT = "Sei un assistente esperto nella rinominazione dei file."
+
+DEFAULT_RULES = [
+    ("Solo lettere, numeri, underscore e trattini", r'^[a-zA-Z0-9_-]+$'),
+    ("Non inizia con un punto", r'^[^.]+$'),
+    ("Lunghezza tra 1 e 255 caratteri", r'^.{1,255}$'),
+]
+
+
+def load_rules(rules_file='rules.json', profile=None):
+    return RuleStore(rules_file, DEFAULT_RULES).rules(profile)
+
+
+def sanitize_filename(filename):
+    sanitized = re.sub(r'[<>:"/|?*]', '', filename)
+    sanitized = sanitized.replace(' ', '_')
+    return sanitized[:255]
+
+
+def select_items(dirs, files, mode):
+    if mode == MODE_ALL:
+        return dirs + files
+    if mode == MODE_FOLDERS:
+        return dirs
+    if mode == MODE_FILES:
+        return files
+    return []
+
+
+class RenameEngine:
+    """Logica di scansione, controllo e rinomina, indipendente dall'interfaccia Qt."""
+
+    def __init__(self, client=None, api_manager=None, mode=MODE_ALL, rules=None, model=None,
+                 budget=None, concurrency=4, limiter=None, max_retries=5, cache=None,
+                 progress=None, index=None, item_retries=2, json_mode=True, transforms=None,
+                 pattern_dedup=False, metrics=None, rule_time_budget=RULE_TIME_BUDGET, content=None,
+                 rule_store=None, rule_profile=None, walker=None, provider=None):
+        # Il provider (e con lui il client e le connessioni) va condiviso tra tutti i motori di una sessione
+        self.provider = provider or ModelProvider(api_manager, client, model=model or DEFAULT_MODEL)
+        self.mode = mode
+        # Con un RuleStore le regole del profilo sono già compilate e non vengono ricompilate a ogni scansione
+        self.rule_store = rule_store
+        self.rule_profile = rule_profile
+        if rule_store is not None:
+            self.rules = rule_store.rules(rule_profile)
+        else:
+            self.rules = list(DEFAULT_RULES) if rules is None else list(rules)
+        self.model = model or self.provider.model
+        self.budget = budget or TokenBudget()
+        self.concurrency = concurrency
+        self.limiter = limiter
+        self.max_retries = max_retries
+        self.cache = cache
+        self.progress = progress or Progress()
+        self.metrics = metrics or Metrics()
+        self.rule_time_budget = rule_time_budget
+        self.content = content
+        # Le cartelle vengono lette in parallelo: sulle condivisioni di rete l'attesa domina il tempo di scansione
+        self.walker = walker or ParallelWalker()
+        self.last_journal = None
+        self.index = index
+        self.last_decisions = []
+        self.item_retries = item_retries
+        self.json_mode = json_mode
+        self.transforms = transforms
+        self.pattern_dedup = pattern_dedup
+        self.stats_lock = threading.Lock()
+        self.naming_stats = {'names': 0, 'names_sent': 0, 'input_tokens_baseline': 0, 'input_tokens_sent': 0}
+
+    @property
+    def client(self):
+        return self.provider.client
+
+    def create_completion(self, messages, max_tokens, **options):
+        if self.limiter:
+            input_tokens = sum(estimate_tokens(message["content"]) for message in messages)
+            self.limiter.acquire(input_tokens + max_tokens)
+        self.progress.call_started()
+        try:
+            with self.metrics.timer(STAGE_MODEL):
+                response = call_with_retry(
+                    lambda: self.provider.complete(messages, max_tokens, self.model, temperature=0.7, **options),
+                    max_retries=self.max_retries,
+                    on_retry=self.metrics.record_retry
+                )
+        except Exception:
+            self.metrics.record_error()
+            raise
+        finally:
+            self.progress.call_finished()
+        self.metrics.record_usage(self.model, getattr(response, 'usage', None))
+        return response
+
+    def walk_entries(self, directory, with_listing=False):
+        """Genera (cartella, dirs, files) con i nomi filtrati; con with_listing aggiunge tutti i nomi presenti."""
+        # Le cartelle vanno rinominate dal basso verso l'alto, altrimenti i percorsi dei figli cambiano
+        topdown = self.mode == MODE_FILES
+        if self.index is None:
+            directories = self.walker.walk(directory, topdown, with_listing=with_listing)
+        else:
+            directories = self.index.walk(directory, topdown, self.walker, with_listing)
+        for root, dirs, files, *listing in self.timed_walk(directories):
+            yield (root, [entry.name for entry in dirs], [entry.name for entry in files]) + tuple(listing)
+
+    def timed_walk(self, walker):
+        """Inoltra le cartelle di walker registrando il tempo impiegato a leggere ciascuna."""
+        while True:
+            start = self.metrics.clock()
+            try:
+                entry = next(walker)
+            except StopIteration:
+                return
+            self.metrics.observe(STAGE_WALK, self.metrics.clock() - start)
+            yield entry
+
+    def rules_fingerprint(self):
+        # Le violazioni salvate per cartella valgono solo per gli stessi filtri su file e cartelle
+        return fingerprint('rules', self.rules, self.mode, self.walker.include, self.walker.exclude)
+
+    def prompt_fingerprint(self, prompt):
+        # Con la lettura del contenuto i nomi proposti cambiano: gli elementi vanno rielaborati
+        extra = ('content',) if self.content is not None else ()
+        return fingerprint('prompt', self.model, SYSTEM_PROMPT, prompt, self.mode, *extra)
+
+    def walk(self, directory):
+        for root, dirs, files in self.walk_entries(directory):
+            yield root, select_items(dirs, files, self.mode)
+
+    def scan(self, directory):
+        for root, items in self.walk(directory):
+            for item in items:
+                yield os.path.join(root, item)
+
+    def compile_rules(self):
+        if self.rule_store is not None:
+            return self.rule_store.ruleset(self.rule_profile)
+        return RuleSet(self.rules, self.rule_time_budget)
+
+    def check_results(self, directory, ruleset=None, stop=None):
+        """Genera le violazioni man mano che vengono trovate; stop è un threading.Event opzionale."""
+        ruleset = ruleset or self.compile_rules()
+        require_extension = self.mode == MODE_FILES
+        if self.index is None:
+            for root, dirs, files in self.timed_walk(self.walker.walk(directory)):
+                if stop is not None and stop.is_set():
+                    return
+                with self.metrics.timer(STAGE_CHECK):
+                    violations = list(ruleset.check_entries(select_items(dirs, files, self.mode),
+                                                            require_extension))
+                yield from violations
+            return
+
+        # Con l'indice le cartelle invariate non vengono rilette né ricontrollate
+        rules_fingerprint = self.rules_fingerprint()
+        try:
+            for root, dirs, files in self.timed_walk(self.index.walk(directory, walker=self.walker)):
+                if stop is not None and stop.is_set():
+                    return
+                violations = self.index.get_violations(root, rules_fingerprint)
+                if violations is None:
+                    with self.metrics.timer(STAGE_CHECK):
+                        violations = list(ruleset.check_entries(select_items(dirs, files, self.mode),
+                                                                require_extension))
+                    self.index.put_violations(root, rules_fingerprint, violations)
+                yield from violations
+        finally:
+            self.index.commit()
+
+    def check(self, directory):
+        return [(violation.path, violation.reason) for violation in self.check_results(directory)]
+
+    def get_ai_suggestion(self, prompt):
+        response = self.create_completion([
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ], max_tokens=100)
+        return response.choices[0].message.content.strip()
+
+    def get_new_file_names(self, file_names, prompt):
+        """Restituisce un nuovo nome per ogni elemento, nello stesso ordine.
+
+        Gli elementi per cui il modello non ha restituito un nome valido valgono None.
+        """
+        return self.name_groups([file_names], prompt)[0]
+
+    def name_groups(self, groups, prompt, stop=None):
+        """Come get_new_file_names, ma per più elenchi (es. una cartella ciascuno) insieme.
+
+        Ogni nome viene chiesto una sola volta per tutto il job anche se compare in più
+        elenchi, e i nomi già presenti nella cache non vengono inviati al modello. Con
+        pattern_dedup i nomi che differiscono solo per i numeri (IMG_0001.jpg, IMG_0002.jpg)
+        vengono chiesti una volta sola e il risultato viene esteso agli altri.
+        I risultati tornano nell'ordine degli elenchi. Se stop viene impostato, i blocchi
+        non ancora partiti restano senza nome.
+        """
+        occurrences = Counter(name for file_names in groups for name in file_names)
+        answers = {}
+        if self.cache is not None and occurrences:
+            answers = self.cache.get_many(self.model, SYSTEM_PROMPT, prompt, list(occurrences))
+            self.progress.advance(sum(occurrences[name] for name in answers))
+        missing = [name for name in occurrences if name not in answers]
+
+        if self.pattern_dedup:
+            # Con un estratto del contenuto ogni file va chiesto a sé
+            members = group_by_pattern([key for key in missing if CONTENT_SEPARATOR not in key])
+            members.update((key, []) for key in missing if CONTENT_SEPARATOR in key)
+        else:
+            members = {name: [] for name in missing}
+        fresh = self.request_many(list(members), prompt, occurrences, stop)
+
+        # I nomi con lo stesso schema per cui l'estensione non funziona vanno chiesti al modello
+        retry = []
+        derived = {}
+        for representative, others in members.items():
+            new_name = fresh.get(representative)
+            for member in others:
+                new_member = fan_out(representative, new_name, member) if new_name else None
+                if new_member:
+                    derived[member] = new_member
+                    self.progress.advance(occurrences[member])
+                else:
+                    retry.append(member)
+        fresh.update(derived)
+        if self.cache is not None and derived:
+            self.cache.put_many(self.model, SYSTEM_PROMPT, prompt, derived)
+        fresh.update(self.request_many(retry, prompt, occurrences, stop))
+
+        answers.update(fresh)
+
+        base_tokens = self.base_tokens(prompt)
+        baseline = 0
+        for file_names in groups:
+            # Quanto sarebbe costato inviare ogni cartella per intero, come un tempo
+            chunks = plan_chunks(file_names, self.budget, base_tokens)
+            baseline += base_tokens * len(chunks) + sum(self.budget.input_tokens(name) for name in file_names)
+        with self.stats_lock:
+            self.naming_stats['names'] += sum(occurrences.values())
+            self.naming_stats['input_tokens_baseline'] += baseline
+
+        return [[answers.get(name) for name in file_names] for file_names in groups]
+
+    def base_tokens(self, prompt):
+        return estimate_tokens(SYSTEM_PROMPT) + estimate_tokens(build_names_prompt([], prompt))
+
+    def request_many(self, names, prompt, occurrences, stop=None):
+        """Invia i nomi a blocchi in parallelo (al massimo self.concurrency) e restituisce {nome: nuovo nome}.
+
+        Le risposte di ogni blocco vanno in cache appena arrivano: se un blocco successivo
+        fallisce, i nomi già pagati non vanno chiesti di nuovo.
+        """
+        jobs = plan_chunks(names, self.budget, self.base_tokens(prompt))
+
+        def run_job(chunk):
+            if stop is not None and stop.is_set():
+                return [None] * len(chunk)
+            answer = self.name_chunk(chunk, prompt)
+            if self.cache is not None:
+                received = {name: new_name for name, new_name in zip(chunk, answer) if new_name is not None}
+                if received:
+                    self.cache.put_many(self.model, SYSTEM_PROMPT, prompt, received)
+            self.progress.advance(sum(occurrences[name] for name in chunk))
+            return answer
+
+        if self.concurrency > 1 and len(jobs) > 1:
+            with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+                answers = list(executor.map(run_job, jobs))
+        else:
+            answers = [run_job(chunk) for chunk in jobs]
+
+        return {name: new_name
+                for chunk, answer in zip(jobs, answers)
+                for name, new_name in zip(chunk, answer) if new_name is not None}
+
+    def token_savings(self):
+        with self.stats_lock:
+            stats = dict(self.naming_stats)
+        stats['input_tokens_saved'] = max(0, stats['input_tokens_baseline'] - stats['input_tokens_sent'])
+        return stats
+
+    def name_chunk(self, chunk, prompt):
+        """Chiede i nomi di un blocco; gli ID mancanti o non validi vengono richiesti di nuovo da soli."""
+        new_names = [None] * len(chunk)
+        pending = list(range(len(chunk)))
+        for _ in range(1 + self.item_retries):
+            answers = self.request_names([chunk[i] for i in pending], prompt)
+            for position, new_name in answers.items():
+                new_names[pending[position]] = new_name
+            pending = [i for i in pending if new_names[i] is None]
+            if not pending:
+                break
+        return new_names
+
+    def request_names(self, file_names, prompt):
+        """Restituisce {posizione in file_names: nuovo nome} per le sole risposte valide.
+
+        Gli elementi di file_names possono includere l'estratto del contenuto (vedi content_key).
+        """
+        options = {'response_format': {'type': 'json_object'}} if self.json_mode else {}
+        names = []
+        snippets = {}
+        for i, key in enumerate(file_names, 1):
+            name, snippet = split_content_key(key)
+            names.append(name)
+            if snippet:
+                snippets[str(i)] = snippet
+        model_prompt = build_names_prompt(names, prompt, snippets)
+        with self.stats_lock:
+            self.naming_stats['names_sent'] += len(file_names)
+            self.naming_stats['input_tokens_sent'] += estimate_tokens(SYSTEM_PROMPT) + estimate_tokens(model_prompt)
+        response = self.create_completion([
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": model_prompt}
+        ], max_tokens=self.budget.max_output_tokens, **options)
+
+        return parse_names_response(response.choices[0].message.content or '', len(file_names))
+
+    def local_pass(self, items, files, ruleset):
+        """Restituisce {elemento: nuovo nome} per gli elementi risolti dalle trasformazioni locali.
+
+        Un elemento è risolto se, dopo le trasformazioni, il nome rispetta tutte le regole;
+        gli altri restano al modello. Senza trasformazioni configurate non risolve nulla.
+        """
+        if self.transforms is None:
+            return {}
+        require_extension = self.mode == MODE_FILES
+        resolved = {}
+        for item in items:
+            is_file = item in files
+            local_name = self.transforms.apply(item, is_file)
+            _, reason = ruleset.evaluate(local_name, is_file, require_extension)
+            if reason is None:
+                resolved[item] = local_name
+        self.transforms.resolved += len(resolved)
+        return resolved
+
+    def propose_names(self, directories, prompt, stop=None, ruleset=None):
+        """Per ogni (cartella, elementi, nomi dei file) restituisce {elemento: nuovo nome o None}.
+
+        Prima le trasformazioni locali, poi il modello solo per gli elementi rimasti,
+        con l'estratto del contenuto dei file se è configurato un ContentSampler. Senza
+        ruleset le regole vengono compilate qui e il loro processo di controllo chiuso alla fine.
+        """
+        owned = ruleset is None and self.transforms is not None
+        if owned:
+            ruleset = self.compile_rules()
+        try:
+            local = [self.local_pass(items, files, ruleset) for _, items, files in directories]
+        finally:
+            if owned:
+                ruleset.close()
+        self.progress.advance(sum(len(resolved) for resolved in local))
+        remote = [[item for item in items if item not in resolved]
+                  for (_, items, _), resolved in zip(directories, local)]
+        keys = remote
+        if self.content is not None:
+            keys = self.content_keys(directories, remote)
+        proposals = []
+        for names, resolved, new_names in zip(remote, local, self.name_groups(keys, prompt, stop)):
+            proposal = dict(zip(names, new_names))
+            proposal.update(resolved)
+            proposals.append(proposal)
+        return proposals
+
+    def content_keys(self, directories, remote):
+        """Aggiunge ai nomi dei file l'estratto del contenuto, letto in parallelo per tutto il job."""
+        paths = [os.path.join(root, item)
+                 for (root, _, files), names in zip(directories, remote) for item in names if item in files]
+        snippets = self.content.sample_many(paths, self.metrics)
+        return [[content_key(item, snippets.get(os.path.join(root, item))) if item in files else item
+                 for item in names]
+                for (root, _, files), names in zip(directories, remote)]
+
+    def preview(self, directory, prompt, limit=5):
+        items = os.listdir(directory)[:limit]
+        files = {item for item in items if os.path.isfile(os.path.join(directory, item))}
+        proposal = self.propose_names([(directory, items, files)], prompt)[0]
+        return [(old_name, sanitize_filename(proposal[old_name]))
+                for old_name in items if proposal.get(old_name) is not None]
+
+    def plan(self, directory, prompt, stop=None):
+        """Calcola tutti gli spostamenti (cartella, vecchio nome, nuovo nome) senza toccare il disco.
+
+        Le collisioni vengono risolte cartella per cartella con un indice dei nomi
+        presenti; l'ordine resta quello di applicazione (cartelle dal basso verso l'alto).
+        """
+        if self.mode not in MODES:
+            raise ValueError("Nessuna opzione di rinomina selezionata")
+
+        prompt_fingerprint = self.prompt_fingerprint(prompt)
+        directories = []
+        # include ed exclude limitano gli elementi da rinominare, non i nomi che possono collidere
+        for root, dirs, files, existing in self.walk_entries(directory, with_listing=True):
+            items = select_items(dirs, files, self.mode)
+            processed = set()
+            if self.index is not None:
+                # Si rinominano solo gli elementi nuovi rispetto all'ultima esecuzione con lo stesso prompt
+                processed = self.index.processed_names(root, prompt_fingerprint)
+                items = [item for item in items if item not in processed]
+            if items:
+                directories.append((root, items, dirs, files, existing, processed))
+        return self.plan_directories(directories, prompt, stop)
+
+    def plan_files(self, paths, prompt, stop=None):
+        """Come plan, ma solo per gli elementi indicati; delle loro cartelle si legge solo l'elenco dei nomi.
+
+        Come in plan si rinominano solo gli elementi previsti dalla modalità (file, cartelle o entrambi).
+        """
+        if self.mode not in MODES:
+            raise ValueError("Nessuna opzione di rinomina selezionata")
+
+        by_directory = {}
+        for path in paths:
+            by_directory.setdefault(os.path.dirname(path), []).append(os.path.basename(path))
+        directories = []
+        for root, names in by_directory.items():
+            try:
+                dirs, files = list_entries(root)
+            except OSError:
+                continue
+            dirs = [entry.name for entry in dirs]
+            files = [entry.name for entry in files]
+            present = set(select_items(dirs, files, self.mode))
+            items = [name for name in dict.fromkeys(names) if name in present]
+            if items:
+                directories.append((root, items, dirs, files, dirs + files, set()))
+        return self.plan_directories(directories, prompt, stop)
+
+    def plan_directories(self, directories, prompt, stop=None):
+        """Spostamenti per le cartelle (cartella, elementi da rinominare, dirs, files, tutti i nomi presenti,
+        nomi già elaborati)."""
+        total = sum(len(items) for _, items, _, _, _, _ in directories)
+
+        self.progress.start_phase(PHASE_NAMING, total)
+        proposals = self.propose_names([(root, items, set(files)) for root, items, _, files, _, _ in directories],
+                                       prompt, stop)
+
+        moves = []
+        self.last_decisions = []
+        for (root, items, dirs, files, existing, processed), proposal in zip(directories, proposals):
+            renames = [(old_name, sanitize_filename(proposal[old_name]))
+                       for old_name in items if proposal.get(old_name) is not None]
+            targets = resolve_targets(existing, renames)
+            moves.extend(order_moves(root, existing, targets))
+            # Nomi che risulteranno già elaborati dopo l'applicazione del piano
+            renamed = {old_name for old_name, _ in targets}
+            answered = {old_name for old_name, _ in renames}
+            after = (((processed & set(existing)) | answered) - renamed) | {final for _, final in targets}
+            self.last_decisions.append((root, after, set(dirs)))
+        return moves
+
+    def create_journal(self, directory, prompt, moves, journal_path=None):
+        header = {'directory': directory, 'prompt': prompt, 'mode': self.mode, 'model': self.model}
+        return RenameJournal.create(journal_path or default_journal_path(), header, moves)
+
+    def rename(self, directory, prompt, stop=None, journal_path=None):
+        """Pianifica, salva il journal e applica le rinomine; restituisce le coppie (vecchio, nuovo percorso).
+
+        Se stop (threading.Event) viene impostato il job si ferma tra un blocco e l'altro;
+        se succede prima della fine della pianificazione non viene rinominato nulla.
+        Il journal usato resta in self.last_journal per riprendere o annullare.
+        """
+        moves = self.plan(directory, prompt, stop)
+        if stop is not None and stop.is_set():
+            return []
+        self.last_journal = self.create_journal(directory, prompt, moves, journal_path)
+        applied = self.last_journal.apply(stop, self.progress, self.metrics)
+        if self.index is not None:
+            self.update_index(self.last_journal, prompt)
+        return applied
+
+    def rename_files(self, paths, prompt, stop=None, journal_path=None):
+        """Rinomina solo i file indicati (ad esempio quelli appena arrivati in una cartella osservata)."""
+        moves = self.plan_files(paths, prompt, stop)
+        if not moves or (stop is not None and stop.is_set()):
+            return []
+        directory = os.path.commonpath([root for root, _, _ in moves])
+        self.last_journal = self.create_journal(directory, prompt, moves, journal_path)
+        return self.last_journal.apply(stop, self.progress, self.metrics)
+
+    def update_index(self, journal, prompt):
+        """Registra nell'indice i nomi elaborati delle cartelle completate e i nuovi percorsi delle cartelle."""
+        prompt_fingerprint = self.prompt_fingerprint(prompt)
+        incomplete = {journal.moves[index][0] for index in journal.pending()}
+        for root, names, _ in self.last_decisions:
+            if root not in incomplete:
+                self.index.mark_processed(root, prompt_fingerprint, names)
+        # I percorsi sul disco sono già cambiati: le cartelle si riconoscono dai nomi letti in pianificazione
+        dir_names = {root: set(dirs) for root, _, dirs in self.last_decisions}
+        for index in sorted(journal.done):
+            root, src, dst = journal.moves[index]
+            if src in dir_names.get(root, ()):
+                dir_names[root].add(dst)
+                self.index.move_prefix(os.path.join(root, src), os.path.join(root, dst))
+        self.index.commit()
+
+    def apply_journal(self, journal_path, stop=None):
+        """Applica (o riprende dopo un crash) un piano salvato, senza chiamate al modello."""
+        self.last_journal = RenameJournal.load(journal_path)
+        return self.last_journal.apply(stop, self.progress, self.metrics)
+
+    def undo_journal(self, journal_path):
+        self.last_journal = RenameJournal.load(journal_path)
+        return self.last_journal.undo(self.progress, self.metrics)
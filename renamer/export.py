@@ -0,0 +1,37 @@
+import csv
+import json
+
+
+class ViolationWriter:
+    """Scrive le violazioni su CSV o JSONL man mano che vengono trovate.
+
+    Il formato dipende dall'estensione del file (.jsonl/.json, altrimenti CSV).
+    """
+
+    FIELDS = ('path', 'name', 'is_dir', 'failed_rules', 'reason')
+
+    def __init__(self, path):
+        self.path = path
+        self.format = 'jsonl' if path.lower().endswith(('.jsonl', '.json')) else 'csv'
+        self.file = open(path, 'w', newline='', encoding='utf-8')
+        self.count = 0
+        if self.format == 'csv':
+            self.writer = csv.writer(self.file)
+            self.writer.writerow(self.FIELDS)
+
+    def write(self, violation):
+        if self.format == 'csv':
+            self.writer.writerow([violation.path, violation.name, int(violation.is_dir),
+                                  ' '.join(str(i) for i in violation.failed_rules), violation.reason])
+        else:
+            self.file.write(json.dumps(violation._asdict(), ensure_ascii=False) + '\n')
+        self.count += 1
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
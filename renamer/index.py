@@ -0,0 +1,192 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from .rules import RuleViolation
+from .walk import ParallelWalker
+
+
+# Una cartella modificata da meno di così potrebbe cambiare ancora con lo stesso mtime
+RACY_SECONDS = 2.0
+
+
+def fingerprint(*parts):
+    payload = json.dumps(parts, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def directory_signature(stat_result):
+    return f"{stat_result.st_mtime_ns}:{stat_result.st_ino}:{stat_result.st_dev}"
+
+
+class IndexedEntry:
+    """Elemento letto dall'indice, con la stessa interfaccia di os.DirEntry usata dal controllo regole."""
+
+    __slots__ = ('name', 'path', '_is_dir', '_is_file', '_is_symlink')
+
+    def __init__(self, root, name, is_dir, is_file, is_symlink):
+        self.name = name
+        self.path = os.path.join(root, name)
+        self._is_dir = is_dir
+        self._is_file = is_file
+        self._is_symlink = is_symlink
+
+    def is_dir(self):
+        return self._is_dir
+
+    def is_file(self):
+        return self._is_file
+
+    def is_symlink(self):
+        return self._is_symlink
+
+
+class DirectoryIndex:
+    """Indice persistente delle cartelle già visitate, per le esecuzioni incrementali.
+
+    Per ogni cartella conserva la firma (mtime, inode, device), l'elenco degli elementi,
+    le ultime violazioni trovate e i nomi già elaborati dalla rinomina. Se la firma non
+    cambia la cartella non viene riletta; violazioni e nomi elaborati valgono solo per
+    lo stesso insieme di regole e lo stesso prompt con cui sono stati calcolati.
+    """
+
+    def __init__(self, path='scan-index.sqlite', clock=time.time):
+        self.path = path
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.dirs_listed = 0
+        self.dirs_reused = 0
+        self.results_reused = 0
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS directories ("
+            "path TEXT PRIMARY KEY, signature TEXT NOT NULL, entries TEXT NOT NULL, "
+            "rules_fingerprint TEXT, violations TEXT, prompt_fingerprint TEXT, processed TEXT)"
+        )
+
+    def _row(self, root):
+        return self.connection.execute(
+            "SELECT signature, entries, rules_fingerprint, violations, prompt_fingerprint, processed "
+            "FROM directories WHERE path = ?", (root,)
+        ).fetchone()
+
+    def list_directory(self, root):
+        """Restituisce (dirs, files, changed); dirs e files sono liste di IndexedEntry."""
+        stat_result = os.stat(root)
+        signature = directory_signature(stat_result)
+        trusted = self.clock() - stat_result.st_mtime > RACY_SECONDS
+
+        with self.lock:
+            row = self._row(root)
+            reused = trusted and row is not None and row[0] == signature
+            if reused:
+                self.dirs_reused += 1
+        if reused:
+            entries = json.loads(row[1])
+            changed = False
+        else:
+            entries = []
+            with os.scandir(root) as iterator:
+                for entry in iterator:
+                    try:
+                        is_dir = entry.is_dir()
+                        is_file = entry.is_file()
+                    except OSError:
+                        is_dir = is_file = False
+                    entries.append((entry.name, is_dir, is_file, entry.is_symlink()))
+            with self.lock:
+                # Le violazioni vanno ricalcolate; i nomi già elaborati restano validi
+                # per gli elementi ancora presenti e vengono filtrati al momento dell'uso
+                self.connection.execute(
+                    "INSERT INTO directories (path, signature, entries) VALUES (?, ?, ?) "
+                    "ON CONFLICT(path) DO UPDATE SET signature = excluded.signature, entries = excluded.entries, "
+                    "rules_fingerprint = NULL, violations = NULL",
+                    (root, signature if trusted else '', json.dumps(entries, ensure_ascii=False))
+                )
+                self.dirs_listed += 1
+            changed = True
+
+        dirs = []
+        files = []
+        for name, is_dir, is_file, is_symlink in entries:
+            (dirs if is_dir else files).append(IndexedEntry(root, name, is_dir, is_file, is_symlink))
+        return dirs, files, changed
+
+    def list_entries(self, root):
+        dirs, files, _ = self.list_directory(root)
+        return dirs, files
+
+    def walk(self, top, topdown=True, walker=None, with_listing=False):
+        """Come ParallelWalker.walk, ma riusa l'elenco delle cartelle la cui firma non è cambiata.
+
+        Con topdown=False restituisce le cartelle figlie prima delle madri.
+        """
+        walker = walker or ParallelWalker()
+        # Percorsi assoluti, così l'indice vale da qualunque cartella di lavoro
+        yield from walker.walk(os.path.abspath(top), topdown, self.list_entries, with_listing)
+
+    def get_violations(self, root, rules_fingerprint):
+        with self.lock:
+            row = self._row(root)
+        if row is None or row[2] != rules_fingerprint or row[3] is None:
+            return None
+        self.results_reused += 1
+        # Il percorso si ricostruisce dalla chiave, che move_prefix aggiorna quando le cartelle cambiano nome;
+        # le righe scritte dalle versioni precedenti iniziano con il percorso completo, che viene ignorato
+        violations = []
+        for values in json.loads(row[3]):
+            name, is_dir, failed_rules, reason = values[-4:]
+            violations.append(RuleViolation(os.path.join(root, name), name, is_dir, failed_rules, reason))
+        return violations
+
+    def put_violations(self, root, rules_fingerprint, violations):
+        with self.lock:
+            self.connection.execute(
+                "UPDATE directories SET rules_fingerprint = ?, violations = ? WHERE path = ?",
+                (rules_fingerprint, json.dumps([[v.name, v.is_dir, v.failed_rules, v.reason] for v in violations],
+                                               ensure_ascii=False), root)
+            )
+
+    def processed_names(self, root, prompt_fingerprint):
+        with self.lock:
+            row = self._row(root)
+        if row is None or row[4] != prompt_fingerprint or row[5] is None:
+            return set()
+        return set(json.loads(row[5]))
+
+    def mark_processed(self, root, prompt_fingerprint, names):
+        with self.lock:
+            self.connection.execute(
+                "UPDATE directories SET prompt_fingerprint = ?, processed = ? WHERE path = ?",
+                (prompt_fingerprint, json.dumps(sorted(names), ensure_ascii=False), root)
+            )
+
+    def move_prefix(self, old_path, new_path):
+        """Aggiorna le chiavi dopo la rinomina di una cartella e di tutte le sue sottocartelle."""
+        prefix = old_path.rstrip(os.sep) + os.sep
+        new_prefix = new_path.rstrip(os.sep) + os.sep
+        with self.lock:
+            # Eventuali voci obsolete con il nuovo percorso vengono sostituite
+            self.connection.execute("DELETE FROM directories WHERE path = ? OR substr(path, 1, ?) = ?",
+                                    (new_path, len(new_prefix), new_prefix))
+            self.connection.execute("UPDATE directories SET path = ? WHERE path = ?", (new_path, old_path))
+            self.connection.execute(
+                "UPDATE directories SET path = ? || substr(path, ?) WHERE substr(path, 1, ?) = ?",
+                (new_prefix, len(prefix) + 1, len(prefix), prefix)
+            )
+
+    def commit(self):
+        with self.lock:
+            self.connection.commit()
+
+    def stats(self):
+        return {'dirs_listed': self.dirs_listed, 'dirs_reused': self.dirs_reused,
+                'results_reused': self.results_reused}
+
+    def close(self):
+        with self.lock:
+            self.connection.commit()
+            self.connection.close()
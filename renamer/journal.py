@@ -0,0 +1,195 @@
+import json
+import os
+import time
+
+from .metrics import STAGE_RENAME
+from .progress import PHASE_RENAMING
+
+
+def name_key(name):
+    # Su Windows due nomi che differiscono solo per le maiuscole collidono
+    return os.path.normcase(name)
+
+
+def unique_name(name, taken):
+    """Restituisce name, o name_1, name_2, ... prima dell'estensione, se già occupato."""
+    if name_key(name) not in taken:
+        return name
+    stem, extension = os.path.splitext(name)
+    counter = 1
+    while True:
+        candidate = f"{stem}_{counter}{extension}"
+        if name_key(candidate) not in taken:
+            return candidate
+        counter += 1
+
+
+def resolve_targets(existing, renames):
+    """Rende univoci i nuovi nomi di una cartella; restituisce (vecchio, nome finale) per ogni rinomina.
+
+    existing sono tutti i nomi presenti nella cartella, renames le coppie (vecchio, nuovo).
+    I nuovi nomi già occupati diventano nome_1, nome_2, ... in modo deterministico.
+    """
+    # Gli elementi senza un nuovo nome valido restano dove sono e il loro nome resta occupato
+    renames = [(old, new) for old, new in renames if new != old and new and new not in ('.', '..')]
+    sources = {old for old, _ in renames}
+    taken = {name_key(name) for name in existing if name not in sources}
+
+    targets = []
+    for old, new in renames:
+        final = unique_name(new, taken)
+        taken.add(name_key(final))
+        targets.append((old, final))
+    return targets
+
+
+def order_moves(root, existing, targets):
+    """Ordina gli spostamenti; se una destinazione è il nome attuale di un altro elemento
+    ancora da spostare (scambi e catene), la sorgente passa prima da un nome temporaneo.
+
+    Restituisce una lista di (cartella, sorgente, destinazione) nell'ordine di esecuzione.
+    """
+    source_keys = {name_key(old) for old, _ in targets}
+    taken = {name_key(name) for name in existing} | {name_key(final) for _, final in targets}
+    to_temp, direct, from_temp = [], [], []
+    for index, (old, final) in enumerate(targets):
+        if name_key(final) in source_keys and name_key(final) != name_key(old):
+            temp = unique_name(f".renamer-{index}.tmp", taken)
+            taken.add(name_key(temp))
+            to_temp.append((root, old, temp))
+            from_temp.append((root, temp, final))
+        else:
+            direct.append((root, old, final))
+    return to_temp + direct + from_temp
+
+
+def plan_directory(root, existing, renames):
+    """Calcola gli spostamenti di una cartella senza collisioni (vedi resolve_targets e order_moves)."""
+    return order_moves(root, existing, resolve_targets(existing, renames))
+
+
+def default_journal_path():
+    return time.strftime('rename-journal-%Y%m%d-%H%M%S.jsonl')
+
+
+class RenameJournal:
+    """Piano di rinomina salvato su file JSONL.
+
+    La prima riga è l'intestazione, seguono gli spostamenti; durante l'esecuzione
+    vengono aggiunte righe "done" e, in caso di annullamento, "undone". Così lo
+    stesso file permette di riprendere dopo un crash e di tornare indietro.
+    """
+
+    def __init__(self, path, header, moves, done=None, undone=None):
+        self.path = path
+        self.header = header
+        self.moves = moves
+        self.done = done if done is not None else set()
+        self.undone = undone if undone is not None else set()
+
+    @classmethod
+    def create(cls, path, header, moves):
+        header = dict(header, type='header', created=time.strftime('%Y-%m-%dT%H:%M:%S'), moves=len(moves))
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(header, ensure_ascii=False) + '\n')
+            for index, (root, src, dst) in enumerate(moves):
+                f.write(json.dumps({'type': 'move', 'id': index, 'dir': root, 'src': src, 'dst': dst},
+                                   ensure_ascii=False) + '\n')
+        os.replace(temp_path, path)
+        return cls(path, header, moves)
+
+    @classmethod
+    def load(cls, path):
+        header = None
+        moves = []
+        done = set()
+        undone = set()
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Ultima riga scritta a metà da un crash
+                    continue
+                if record['type'] == 'header':
+                    header = record
+                elif record['type'] == 'move':
+                    moves.append((record['dir'], record['src'], record['dst']))
+                elif record['type'] == 'done':
+                    done.add(record['id'])
+                elif record['type'] == 'undone':
+                    undone.add(record['id'])
+        if header is None:
+            raise ValueError(f"{path} non è un journal di rinomina valido.")
+        return cls(path, header, moves, done, undone)
+
+    def pending(self):
+        return [index for index in range(len(self.moves)) if index not in self.done]
+
+    def _record(self, f, kind, index):
+        f.write(json.dumps({'type': kind, 'id': index}) + '\n')
+        f.flush()
+
+    def _rename(self, src_path, dst_path, metrics):
+        if metrics is None:
+            os.rename(src_path, dst_path)
+            return
+        with metrics.timer(STAGE_RENAME):
+            os.rename(src_path, dst_path)
+
+    def apply(self, stop=None, progress=None, metrics=None):
+        """Esegue gli spostamenti non ancora fatti; si ferma solo tra una cartella e l'altra."""
+        pending = self.pending()
+        if progress is not None:
+            progress.start_phase(PHASE_RENAMING, len(pending))
+        applied = []
+        current_dir = None
+        with open(self.path, 'a', encoding='utf-8') as f:
+            for index in pending:
+                root, src, dst = self.moves[index]
+                if root != current_dir:
+                    if stop is not None and stop.is_set():
+                        break
+                    current_dir = root
+                src_path, dst_path = os.path.join(root, src), os.path.join(root, dst)
+                if os.path.lexists(src_path):
+                    if os.path.lexists(dst_path) and name_key(src) != name_key(dst):
+                        raise FileExistsError(f"Impossibile rinominare {src_path}: {dst_path} esiste già.")
+                    self._rename(src_path, dst_path, metrics)
+                elif not os.path.lexists(dst_path):
+                    raise FileNotFoundError(f"Impossibile rinominare {src_path}: l'elemento non esiste più.")
+                # Se esiste solo la destinazione lo spostamento era già avvenuto prima di un crash
+                self._record(f, 'done', index)
+                self.done.add(index)
+                applied.append((src_path, dst_path))
+                if progress is not None:
+                    progress.advance()
+            os.fsync(f.fileno())
+        return applied
+
+    def undo(self, progress=None, metrics=None):
+        """Riporta ai nomi originali gli spostamenti eseguiti, in ordine inverso."""
+        to_undo = [index for index in sorted(self.done, reverse=True) if index not in self.undone]
+        if progress is not None:
+            progress.start_phase(PHASE_RENAMING, len(to_undo))
+        restored = []
+        with open(self.path, 'a', encoding='utf-8') as f:
+            for index in to_undo:
+                root, src, dst = self.moves[index]
+                src_path, dst_path = os.path.join(root, src), os.path.join(root, dst)
+                if os.path.lexists(dst_path):
+                    if os.path.lexists(src_path) and name_key(src) != name_key(dst):
+                        raise FileExistsError(f"Impossibile ripristinare {dst_path}: {src_path} esiste già.")
+                    self._rename(dst_path, src_path, metrics)
+                elif not os.path.lexists(src_path):
+                    raise FileNotFoundError(f"Impossibile ripristinare {dst_path}: l'elemento non esiste più.")
+                self._record(f, 'undone', index)
+                self.undone.add(index)
+                restored.append((dst_path, src_path))
+                if progress is not None:
+                    progress.advance()
+            os.fsync(f.fileno())
+        return restored
@@ -0,0 +1,194 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+STAGE_WALK = 'walk'
+STAGE_CHECK = 'check'
+STAGE_MODEL = 'model_call'
+STAGE_RENAME = 'rename'
+STAGE_CONTENT = 'content'
+# Modalità watch: durata di ogni gruppo e attesa di ogni file dal primo evento alla rinomina
+STAGE_BATCH = 'watch_batch'
+STAGE_LATENCY = 'watch_latency'
+
+# Limiti superiori dei bucket in secondi, come negli istogrammi Prometheus
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Prezzi in dollari per milione di token (ingresso, uscita); i modelli non elencati non hanno un costo stimato
+MODEL_PRICES = {
+    'gpt-4o': (2.50, 10.00),
+    'gpt-4o-mini': (0.15, 0.60),
+    'gpt-4-turbo': (10.00, 30.00),
+    'gpt-3.5-turbo': (0.50, 1.50),
+}
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def cumulative(self):
+        """Coppie (limite, conteggio cumulativo), l'ultima con limite '+Inf'."""
+        total = 0
+        result = []
+        for bound, count in zip(list(self.buckets) + ['+Inf'], self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 6),
+            'avg': round(self.sum / self.count, 6) if self.count else None,
+            'max': round(self.max, 6),
+            'buckets': {str(bound): count for bound, count in self.cumulative()},
+        }
+
+
+class Metrics:
+    """Tempi per fase, richieste, token, nuovi tentativi e costo stimato di un job, condivisi tra i thread."""
+
+    def __init__(self, prices=None, clock=time.perf_counter):
+        self.prices = dict(MODEL_PRICES, **(prices or {}))
+        self.clock = clock
+        self.started = clock()
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.requests = {}
+        self.prompt_tokens = {}
+        self.completion_tokens = {}
+        self.retries = {}
+        self.errors = 0
+
+    def observe(self, stage, seconds):
+        with self.lock:
+            if stage not in self.histograms:
+                self.histograms[stage] = Histogram()
+            self.histograms[stage].observe(seconds)
+
+    @contextmanager
+    def timer(self, stage):
+        start = self.clock()
+        try:
+            yield
+        finally:
+            self.observe(stage, self.clock() - start)
+
+    def record_usage(self, model, usage):
+        """Registra una risposta del modello; usage è il campo usage della risposta (può mancare)."""
+        with self.lock:
+            self.requests[model] = self.requests.get(model, 0) + 1
+            if usage is not None:
+                self.prompt_tokens[model] = self.prompt_tokens.get(model, 0) + (usage.prompt_tokens or 0)
+                self.completion_tokens[model] = (self.completion_tokens.get(model, 0)
+                                                 + (usage.completion_tokens or 0))
+
+    def record_retry(self, error):
+        reason = str(getattr(error, 'status_code', None) or type(error).__name__)
+        with self.lock:
+            self.retries[reason] = self.retries.get(reason, 0) + 1
+
+    def record_error(self):
+        with self.lock:
+            self.errors += 1
+
+    def cost(self, model):
+        if model not in self.prices:
+            return None
+        input_price, output_price = self.prices[model]
+        return (self.prompt_tokens.get(model, 0) * input_price
+                + self.completion_tokens.get(model, 0) * output_price) / 1000000
+
+    def summary(self):
+        with self.lock:
+            models = {}
+            for model in self.requests:
+                cost = self.cost(model)
+                models[model] = {
+                    'requests': self.requests[model],
+                    'prompt_tokens': self.prompt_tokens.get(model, 0),
+                    'completion_tokens': self.completion_tokens.get(model, 0),
+                    'estimated_cost_usd': round(cost, 6) if cost is not None else None,
+                }
+            costs = [model['estimated_cost_usd'] for model in models.values()
+                     if model['estimated_cost_usd'] is not None]
+            return {
+                'elapsed_seconds': round(self.clock() - self.started, 3),
+                'stages': {stage: histogram.summary() for stage, histogram in self.histograms.items()},
+                'models': models,
+                'requests': sum(self.requests.values()),
+                'prompt_tokens': sum(self.prompt_tokens.values()),
+                'completion_tokens': sum(self.completion_tokens.values()),
+                'retries': dict(self.retries),
+                'errors': self.errors,
+                'estimated_cost_usd': round(sum(costs), 6),
+            }
+
+    def describe(self):
+        """Riepilogo di una riga per l'interfaccia e la riga di comando."""
+        summary = self.summary()
+        return (f"Richieste: {summary['requests']} - token: {summary['prompt_tokens']} in ingresso, "
+                f"{summary['completion_tokens']} in uscita - nuovi tentativi: {sum(summary['retries'].values())}"
+                f" - costo stimato: ${summary['estimated_cost_usd']:.4f}")
+
+    def write_json(self, path):
+        write_atomic(path, json.dumps(self.summary(), indent=2, ensure_ascii=False) + '\n')
+
+    def prometheus(self):
+        """Metriche nel formato testuale di Prometheus (per il textfile collector di node_exporter)."""
+        summary = self.summary()
+        lines = ['# HELP renamer_stage_seconds Durata delle operazioni per fase.',
+                 '# TYPE renamer_stage_seconds histogram']
+        with self.lock:
+            histograms = sorted(self.histograms.items())
+            for stage, histogram in histograms:
+                for bound, count in histogram.cumulative():
+                    lines.append(f'renamer_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {count}')
+                lines.append(f'renamer_stage_seconds_sum{{stage="{stage}"}} {histogram.sum}')
+                lines.append(f'renamer_stage_seconds_count{{stage="{stage}"}} {histogram.count}')
+
+        counters = (
+            ('renamer_api_requests_total', 'Richieste al modello completate.', 'requests'),
+            ('renamer_prompt_tokens_total', 'Token in ingresso riportati dal modello.', 'prompt_tokens'),
+            ('renamer_completion_tokens_total', 'Token in uscita riportati dal modello.', 'completion_tokens'),
+            ('renamer_estimated_cost_usd_total', 'Costo stimato in dollari.', 'estimated_cost_usd'),
+        )
+        for name, help_text, key in counters:
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+            for model, values in sorted(summary['models'].items()):
+                if values[key] is not None:
+                    lines.append(f'{name}{{model="{model}"}} {values[key]}')
+        lines += ['# HELP renamer_retries_total Nuovi tentativi dopo errori temporanei.',
+                  '# TYPE renamer_retries_total counter']
+        for reason, count in sorted(summary['retries'].items()):
+            lines.append(f'renamer_retries_total{{reason="{reason}"}} {count}')
+        lines += ['# HELP renamer_errors_total Chiamate al modello fallite definitivamente.',
+                  '# TYPE renamer_errors_total counter',
+                  f'renamer_errors_total {summary["errors"]}']
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path):
+        # node_exporter non deve mai leggere un file scritto a metà
+        write_atomic(path, self.prometheus())
+
+
+def write_atomic(path, text):
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(temp_path, path)
@@ -0,0 +1,56 @@
+import threading
+import time
+
+
+PHASE_NAMING = 'naming'
+PHASE_RENAMING = 'renaming'
+
+
+class Progress:
+    """Contatori condivisi tra i thread di un job: avanzamento, velocità, ETA e chiamate in corso."""
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.phase = None
+        self.total = 0
+        self.done = 0
+        self.phase_started = clock()
+        self.in_flight = 0
+        self.api_calls = 0
+
+    def start_phase(self, phase, total):
+        with self.lock:
+            self.phase = phase
+            self.total = total
+            self.done = 0
+            self.phase_started = self.clock()
+
+    def advance(self, count=1):
+        with self.lock:
+            self.done += count
+
+    def call_started(self):
+        with self.lock:
+            self.in_flight += 1
+            self.api_calls += 1
+
+    def call_finished(self):
+        with self.lock:
+            self.in_flight -= 1
+
+    def snapshot(self):
+        with self.lock:
+            elapsed = self.clock() - self.phase_started
+            rate = self.done / elapsed if elapsed > 0 else 0.0
+            remaining = self.total - self.done
+            eta = remaining / rate if rate > 0 else None
+            return {
+                'phase': self.phase,
+                'total': self.total,
+                'done': self.done,
+                'rate': rate,
+                'eta': eta,
+                'in_flight': self.in_flight,
+                'api_calls': self.api_calls,
+            }
@@ -0,0 +1,103 @@
+import json
+import os
+import threading
+
+from .api import APIKeyManager
+
+
+DEFAULT_MODEL = "gpt-4o"
+
+DEFAULT_PROVIDER = {
+    'model': DEFAULT_MODEL,
+    # Server compatibile con le API OpenAI, ad esempio http://localhost:8080/v1 per llama.cpp o vLLM
+    'base_url': None,
+    'timeout': 60.0,
+    'connect_timeout': 10.0,
+    # Connessioni HTTP mantenute aperte e riusate tra le richieste (almeno quante le richieste in parallelo)
+    'pool_size': 16,
+}
+
+# I server locali di solito non controllano la chiave, ma il client OpenAI ne richiede una
+LOCAL_API_KEY = 'nessuna-chiave'
+
+
+class ModelProvider:
+    """Accesso al modello condiviso da tutta l'applicazione: un solo client e un solo pool di connessioni.
+
+    Le opzioni sono quelle di DEFAULT_PROVIDER. I nuovi tentativi restano a carico di
+    call_with_retry, quindi il client non ne fa altri per conto suo. Con client si
+    usa un client già pronto (ad esempio quello finto dei benchmark).
+    """
+
+    def __init__(self, api_manager=None, client=None, **options):
+        unknown = set(options) - set(DEFAULT_PROVIDER)
+        if unknown:
+            raise ValueError(f"Opzioni del modello sconosciute: {', '.join(sorted(unknown))}")
+        self.options = dict(DEFAULT_PROVIDER, **{key: value for key, value in options.items() if value is not None})
+        if self.options['pool_size'] < 1:
+            raise ValueError("L'opzione pool_size deve essere almeno 1.")
+        self.api_manager = api_manager
+        self._client = client
+        self.owns_client = client is None
+        self.lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path='provider.json', api_manager=None, **overrides):
+        """Legge le opzioni da path se esiste; gli argomenti diversi da None hanno la precedenza."""
+        options = {}
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            with open(path, 'r', encoding='utf-8') as f:
+                options = json.load(f)
+        options.update({key: value for key, value in overrides.items() if value is not None})
+        return cls(api_manager, **options)
+
+    @property
+    def model(self):
+        return self.options['model']
+
+    @property
+    def base_url(self):
+        return self.options['base_url']
+
+    def api_key(self):
+        if self.api_manager is None:
+            self.api_manager = APIKeyManager(interactive=False)
+        if self.base_url and not self.api_manager.load_api_key():
+            return LOCAL_API_KEY
+        return self.api_manager.get_api_key()
+
+    @property
+    def client(self):
+        # Il client viene creato solo alla prima chiamata al modello
+        with self.lock:
+            if self._client is None:
+                api_key = self.api_key()
+                # Import ritardato: chi usa solo scan/check non paga il caricamento di openai
+                import httpx
+                from openai import OpenAI
+
+                timeout = httpx.Timeout(self.options['timeout'], connect=self.options['connect_timeout'])
+                pool_size = self.options['pool_size']
+                http_client = httpx.Client(timeout=timeout, limits=httpx.Limits(
+                    max_connections=pool_size, max_keepalive_connections=pool_size))
+                self._client = OpenAI(api_key=api_key, base_url=self.base_url, timeout=timeout, max_retries=0,
+                                      http_client=http_client)
+        return self._client
+
+    def complete(self, messages, max_tokens, model=None, **options):
+        return self.client.chat.completions.create(
+            model=model or self.model,
+            messages=messages,
+            max_tokens=max_tokens,
+            n=1,
+            **options
+        )
+
+    def describe(self):
+        return f"{self.model} su {self.base_url}" if self.base_url else self.model
+
+    def close(self):
+        with self.lock:
+            if self.owns_client and self._client is not None:
+                self._client.close()
+                self._client = None
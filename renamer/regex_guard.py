@@ -0,0 +1,355 @@
+import multiprocessing
+import re
+import string
+import threading
+
+try:
+    from re import _constants as sre_constants, _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_constants
+    import sre_parse
+
+
+# Tempo massimo in secondi per valutare una regola su un nome
+RULE_TIME_BUDGET = 0.1
+# Avvio del processo di controllo (su Windows e macOS il processo viene creato da zero)
+GUARD_START_TIMEOUT = 15.0
+
+# Nomi di prova che ogni regola nuova deve valutare entro il limite di tempo prima di essere salvata:
+# nomi comuni e nomi lunghi costruiti per far esplodere il backtracking
+RULE_CORPUS = (
+    'documento.pdf',
+    'Foto Vacanza 2021 (3).JPG',
+    'IMG_0001.jpg',
+    '.gitignore',
+    'archivio.tar.gz',
+    'relazione_finale-v2.docx',
+    'àèìòù ñ.txt',
+    'a',
+    'a' * 255,
+    'a' * 254 + '!',
+    '1' * 254 + 'x',
+    '_-' * 127 + '!',
+    'a_' * 127 + '!',
+    'a.' * 127 + '!',
+    'a-' * 127 + '.',
+    'aA0_-' * 50 + '!!!!!',
+    ' ' * 254 + '.',
+    'a ' * 127 + '!',
+)
+
+# Caratteri usati per confrontare gli insiemi di caratteri delle parti di un pattern
+ALPHABET = frozenset(string.printable + 'àèéìòùÀÈÉÌÒÙñçß€')
+
+REPEATS = {sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT}
+POSSESSIVE_REPEAT = getattr(sre_constants, 'POSSESSIVE_REPEAT', None)
+ATOMIC_GROUP = getattr(sre_constants, 'ATOMIC_GROUP', None)
+ZERO_WIDTH = {sre_constants.AT, sre_constants.ASSERT, sre_constants.ASSERT_NOT}
+
+
+def category_chars(category):
+    name = str(category)
+    if 'DIGIT' in name:
+        chars = {c for c in ALPHABET if c.isdigit()}
+    elif 'SPACE' in name:
+        chars = {c for c in ALPHABET if c.isspace()}
+    elif 'WORD' in name:
+        chars = {c for c in ALPHABET if c.isalnum() or c == '_'}
+    else:
+        chars = {'\n', '\r'}
+    return ALPHABET - chars if 'NOT' in name else frozenset(chars)
+
+
+def in_chars(items):
+    chars = set()
+    negate = False
+    for op, av in items:
+        if op is sre_constants.NEGATE:
+            negate = True
+        elif op is sre_constants.LITERAL:
+            chars.add(chr(av))
+        elif op is sre_constants.RANGE:
+            chars.update(c for c in ALPHABET if av[0] <= ord(c) <= av[1])
+        elif op is sre_constants.CATEGORY:
+            chars.update(category_chars(av))
+    return ALPHABET - chars if negate else frozenset(chars)
+
+
+def children(op, av):
+    """Sotto-pattern contenuti in un elemento del parse tree."""
+    if op in REPEATS or op is POSSESSIVE_REPEAT:
+        return [av[2]]
+    if op is sre_constants.SUBPATTERN:
+        return [av[-1]]
+    if op is sre_constants.BRANCH:
+        return list(av[1])
+    if op in (sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+        return [av[1]]
+    if op is ATOMIC_GROUP:
+        return [av]
+    if op is sre_constants.GROUPREF_EXISTS:
+        return [branch for branch in av[1:] if branch is not None]
+    return []
+
+
+def item_chars(op, av):
+    """Tutti i caratteri che un elemento può consumare."""
+    if op is sre_constants.LITERAL:
+        return frozenset(chr(av))
+    if op is sre_constants.NOT_LITERAL:
+        return ALPHABET - {chr(av)}
+    if op in (sre_constants.ANY, sre_constants.GROUPREF):
+        return ALPHABET
+    if op is sre_constants.IN:
+        return in_chars(av)
+    if op in ZERO_WIDTH:
+        return frozenset()
+    chars = set()
+    for pattern in children(op, av):
+        for child in pattern:
+            chars |= item_chars(*child)
+    return frozenset(chars)
+
+
+def nullable(pattern):
+    return all(item_nullable(op, av) for op, av in pattern)
+
+
+def item_nullable(op, av):
+    if op in ZERO_WIDTH or op is sre_constants.GROUPREF:
+        return True
+    if op in REPEATS or op is POSSESSIVE_REPEAT:
+        return av[0] == 0 or nullable(av[2])
+    if op in (sre_constants.SUBPATTERN, ATOMIC_GROUP, sre_constants.BRANCH, sre_constants.GROUPREF_EXISTS):
+        return any(nullable(pattern) for pattern in children(op, av))
+    return False
+
+
+def first_chars(pattern):
+    """Caratteri con cui può iniziare ciò che pattern consuma."""
+    chars = set()
+    for op, av in pattern:
+        if op in REPEATS or op is POSSESSIVE_REPEAT or op in (sre_constants.SUBPATTERN, ATOMIC_GROUP,
+                                                               sre_constants.BRANCH,
+                                                               sre_constants.GROUPREF_EXISTS):
+            for child in children(op, av):
+                chars |= first_chars(child)
+        elif op not in ZERO_WIDTH:
+            chars |= item_chars(op, av)
+        if not item_nullable(op, av):
+            break
+    return frozenset(chars)
+
+
+def sequence(pattern):
+    """Elementi in sequenza di pattern, entrando nei gruppi semplici."""
+    for op, av in pattern:
+        if op is sre_constants.SUBPATTERN:
+            yield from sequence(av[-1])
+        else:
+            yield op, av
+
+
+def variable_repeats(pattern):
+    """Ripetizioni con backtracking e lunghezza variabile contenute in pattern (anche annidate)."""
+    for op, av in pattern:
+        if op is ATOMIC_GROUP or op is POSSESSIVE_REPEAT:
+            continue
+        if op in REPEATS and av[1] > av[0] and av[1] > 1 and not nullable(av[2]):
+            yield op, av
+        for child in children(op, av):
+            yield from variable_repeats(child)
+
+
+def overlapping_branch(pattern):
+    for op, av in pattern:
+        if op is ATOMIC_GROUP or op is POSSESSIVE_REPEAT:
+            continue
+        if op is sre_constants.BRANCH:
+            seen = set()
+            for branch in av[1]:
+                first = first_chars(branch)
+                if seen & first or nullable(branch):
+                    return True
+                seen |= first
+        if any(overlapping_branch(child) for child in children(op, av)):
+            return True
+    return False
+
+
+def repeat_reason(body):
+    """Motivo per cui ripetere body può richiedere un tempo esponenziale, oppure None.
+
+    È il caso di una ripetizione variabile dentro un'altra, a meno che ogni iterazione
+    non contenga un separatore obbligatorio che la parte interna non può consumare
+    (come in (_[a-z]+)*), e di alternative che possono iniziare con lo stesso carattere.
+    """
+    inner = list(variable_repeats(body))
+    if inner:
+        inner_chars = frozenset().union(*(item_chars(op, av) for op, av in inner))
+        separated = any(not item_nullable(op, av) and item_chars(op, av) and not item_chars(op, av) & inner_chars
+                        for op, av in sequence(body))
+        if not separated:
+            return "quantificatori annidati"
+    if overlapping_branch(body):
+        return "alternative sovrapposte dentro una ripetizione"
+    return None
+
+
+def catastrophic_reason(regex):
+    """Analisi statica: motivo per cui regex rischia un backtracking catastrofico, oppure None.
+
+    Solleva ValueError se regex non è valida.
+    """
+    try:
+        tree = sre_parse.parse(regex)
+    except re.error as e:
+        raise ValueError(f"Espressione regolare non valida: {e}")
+    return find_reason(tree)
+
+
+def find_reason(pattern):
+    for op, av in pattern:
+        if op is ATOMIC_GROUP or op is POSSESSIVE_REPEAT:
+            continue
+        if op in REPEATS and av[1] > 1:
+            reason = repeat_reason(av[2])
+            if reason:
+                return reason
+        for child in children(op, av):
+            reason = find_reason(child)
+            if reason:
+                return reason
+    return None
+
+
+class RuleTimeout(Exception):
+    def __init__(self, index, name):
+        super().__init__(f"La regola {index + 1} ha superato il limite di tempo sul nome {name!r}")
+        self.index = index
+        self.name = name
+
+
+def guard_main(connection, regexes):
+    patterns = [re.compile(regex) for regex in regexes]
+    connection.send('pronto')
+    while True:
+        try:
+            index, name = connection.recv()
+        except EOFError:
+            return
+        connection.send(patterns[index].match(name) is not None)
+
+
+class GuardedMatcher:
+    """Valuta le regole in un processo separato, che viene terminato se supera il limite di tempo.
+
+    Il motore di re non si può interrompere dall'esterno: l'unico modo sicuro di
+    fermare un pattern bloccato è chiudere il processo che lo sta eseguendo.
+    """
+
+    def __init__(self, regexes, time_budget=RULE_TIME_BUDGET):
+        self.regexes = list(regexes)
+        self.time_budget = time_budget
+        self.lock = threading.Lock()
+        self.process = None
+        self.connection = None
+
+    def start(self):
+        self.connection, child = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=guard_main, args=(child, self.regexes), daemon=True)
+        self.process.start()
+        child.close()
+        if not self.connection.poll(GUARD_START_TIMEOUT):
+            self.close()
+            raise OSError("Impossibile avviare il processo di controllo delle regole.")
+        self.connection.recv()
+
+    def match(self, index, name):
+        """True se la regola index corrisponde a name; RuleTimeout se supera il limite di tempo."""
+        with self.lock:
+            if self.process is None:
+                self.start()
+            self.connection.send((index, name))
+            if self.connection.poll(self.time_budget):
+                return self.connection.recv()
+            self.close()
+            raise RuleTimeout(index, name)
+
+    def close(self):
+        if self.process is not None:
+            self.connection.close()
+            self.process.kill()
+            self.process.join()
+            self.process = None
+            self.connection = None
+
+
+# Esito della prova sul corpus per (regex, limite di tempo): ogni regola viene provata una volta per processo
+CORPUS_RESULTS = {}
+
+
+def slow_rules(regexes, corpus=RULE_CORPUS, time_budget=RULE_TIME_BUDGET):
+    """Restituisce {indice: motivo} per le regex che superano time_budget su un nome del corpus.
+
+    La prova avviene nel processo di controllo, quindi anche una regola lentissima
+    costa al massimo time_budget. Serve per le regole lette da file, che non sono
+    passate da validate_rule e che l'analisi statica non segnala (ad esempio
+    backtracking polinomiale come ^(.*)(.*)(.*)x$).
+    """
+    reasons = {}
+    todo = []
+    for i, regex in enumerate(regexes):
+        key = (regex, time_budget)
+        if key not in CORPUS_RESULTS:
+            todo.append(i)
+        elif CORPUS_RESULTS[key]:
+            reasons[i] = CORPUS_RESULTS[key]
+    if not todo:
+        return reasons
+    matcher = GuardedMatcher([regexes[i] for i in todo], time_budget)
+    try:
+        for position, i in enumerate(todo):
+            reason = None
+            for name in corpus:
+                try:
+                    matcher.match(position, name)
+                except RuleTimeout:
+                    reason = f"oltre {time_budget} s sul nome di prova {name[:40]!r}"
+                    break
+            CORPUS_RESULTS[(regexes[i], time_budget)] = reason
+            if reason:
+                reasons[i] = reason
+    finally:
+        matcher.close()
+    return reasons
+
+
+def extract_regex(text):
+    """Ripulisce la risposta del modello da blocchi di codice, apici inversi e delimitatori /.../."""
+    text = text.strip()
+    fenced = re.search(r'```(?:regex|re|python)?\s*\n?(.*?)\n?```', text, re.S)
+    if fenced:
+        text = fenced.group(1).strip()
+    if len(text) > 1 and text[0] == text[-1] and text[0] in '`/':
+        text = text[1:-1]
+    return text
+
+
+def validate_rule(regex, corpus=RULE_CORPUS, time_budget=RULE_TIME_BUDGET):
+    """Controlla una regola prima di salvarla; solleva ValueError con il motivo se non è accettabile.
+
+    La regola deve compilare, non contenere costrutti a rischio di backtracking
+    catastrofico e valutare ogni nome del corpus di prova entro time_budget.
+    """
+    reason = catastrophic_reason(regex)
+    if reason:
+        raise ValueError(f"Espressione regolare a rischio di blocco ({reason}): {regex}")
+    matcher = GuardedMatcher([regex], time_budget)
+    try:
+        for name in corpus:
+            matcher.match(0, name)
+    except RuleTimeout as e:
+        raise ValueError(f"Espressione regolare troppo lenta sul nome di prova {e.name[:40]!r}...: {regex}")
+    finally:
+        matcher.close()
@@ -0,0 +1,165 @@
+import json
+import os
+import threading
+
+from .regex_guard import RULE_TIME_BUDGET
+from .rules import RuleSet
+
+
+DEFAULT_PROFILE = 'default'
+# Le modifiche ravvicinate vengono scritte insieme dopo questo intervallo senza altre modifiche
+SAVE_DELAY = 1.0
+
+
+class RuleStore:
+    """Profili di regole con nome, caricati una volta sola e modificati in memoria.
+
+    Il file viene riscritto in modo atomico (file temporaneo + rinomina) al più una
+    volta per raffica di modifiche, dopo save_delay secondi di calma, o subito con
+    flush. Ogni profilo conserva la propria versione compilata, riusata finché le
+    regole non cambiano. Un file con il solo profilo default resta nel formato a
+    lista delle versioni precedenti.
+    """
+
+    def __init__(self, path='rules.json', defaults=(), save_delay=SAVE_DELAY, time_budget=RULE_TIME_BUDGET):
+        self.path = path
+        self.defaults = [tuple(rule) for rule in defaults]
+        self.save_delay = save_delay
+        self.time_budget = time_budget
+        self.lock = threading.RLock()
+        self.profiles = {}
+        self.active = DEFAULT_PROFILE
+        self.compiled = {}
+        self.timer = None
+        self.dirty = False
+        self.saves = 0
+        self.load()
+
+    def load(self):
+        data = None
+        if os.path.exists(self.path) and os.path.getsize(self.path) > 0:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        with self.lock:
+            if isinstance(data, dict):
+                self.profiles = {name: [(description, regex) for description, regex in rules]
+                                 for name, rules in data.get('profiles', {}).items()}
+                self.active = data.get('active', DEFAULT_PROFILE)
+            elif data:
+                self.profiles = {DEFAULT_PROFILE: [(description, regex) for description, regex in data]}
+                self.active = DEFAULT_PROFILE
+            else:
+                self.profiles = {}
+            if not self.profiles:
+                self.profiles[DEFAULT_PROFILE] = list(self.defaults)
+            if self.active not in self.profiles:
+                self.active = next(iter(self.profiles))
+            self.compiled = {}
+
+    def profile(self, name=None):
+        name = name or self.active
+        if name not in self.profiles:
+            raise ValueError(f"Profilo di regole sconosciuto: {name}")
+        return name
+
+    def profile_names(self):
+        with self.lock:
+            return list(self.profiles)
+
+    def rules(self, profile=None):
+        with self.lock:
+            return list(self.profiles[self.profile(profile)])
+
+    def ruleset(self, profile=None):
+        """RuleSet pronto per una scansione; la compilazione viene rifatta solo se le regole cambiano."""
+        with self.lock:
+            name = self.profile(profile)
+            if name not in self.compiled:
+                self.compiled[name] = RuleSet(self.profiles[name], self.time_budget)
+            template = self.compiled[name]
+        # Ogni scansione ha contatori e processo di controllo propri
+        return template.copy()
+
+    def set_rules(self, rules, profile=None):
+        with self.lock:
+            name = self.profile(profile)
+            self.profiles[name] = [(description, regex) for description, regex in rules]
+            self.compiled.pop(name, None)
+            self.schedule_save()
+
+    def add_rule(self, description, regex, profile=None):
+        self.set_rules(self.rules(profile) + [(description, regex)], profile)
+
+    def replace_rule(self, index, description, regex, profile=None):
+        rules = self.rules(profile)
+        rules[index] = (description, regex)
+        self.set_rules(rules, profile)
+
+    def remove_rule(self, index, profile=None):
+        rules = self.rules(profile)
+        del rules[index]
+        self.set_rules(rules, profile)
+
+    def create_profile(self, name, rules=None):
+        name = name.strip()
+        with self.lock:
+            if not name:
+                raise ValueError("Il nome del profilo non può essere vuoto.")
+            if name in self.profiles:
+                raise ValueError(f"Il profilo {name} esiste già.")
+            self.profiles[name] = list(self.defaults) if rules is None else [tuple(rule) for rule in rules]
+            self.schedule_save()
+
+    def delete_profile(self, name):
+        with self.lock:
+            self.profile(name)
+            if len(self.profiles) == 1:
+                raise ValueError("Deve rimanere almeno un profilo.")
+            del self.profiles[name]
+            self.compiled.pop(name, None)
+            if self.active == name:
+                self.active = next(iter(self.profiles))
+            self.schedule_save()
+
+    def set_active(self, name):
+        with self.lock:
+            self.active = self.profile(name)
+            self.schedule_save()
+
+    def schedule_save(self):
+        with self.lock:
+            self.dirty = True
+            if self.timer is not None:
+                self.timer.cancel()
+            if self.save_delay is None:
+                self.timer = None
+                return
+            self.timer = threading.Timer(self.save_delay, self.flush)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def serialize(self):
+        if list(self.profiles) == [DEFAULT_PROFILE]:
+            return [list(rule) for rule in self.profiles[DEFAULT_PROFILE]]
+        return {'active': self.active,
+                'profiles': {name: [list(rule) for rule in rules] for name, rules in self.profiles.items()}}
+
+    def flush(self):
+        """Scrive subito le modifiche in sospeso."""
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            if not self.dirty:
+                return
+            temp_path = self.path + '.tmp'
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.serialize(), f, ensure_ascii=False, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.path)
+            self.dirty = False
+            self.saves += 1
+
+    def close(self):
+        self.flush()
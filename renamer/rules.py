@@ -0,0 +1,162 @@
+import copy
+import os
+import re
+import time
+from collections import namedtuple
+
+from .regex_guard import RULE_TIME_BUDGET, GuardedMatcher, RuleTimeout, catastrophic_reason, slow_rules
+
+
+# Regola predefinita che non ha senso per i file con estensione
+DOT_RULE = "Non inizia con un punto"
+# Un riferimento a un gruppo numerato cambierebbe significato nel pattern combinato
+BACKREFERENCE = re.compile(r'\\[1-9]|\(\?P=')
+
+RuleViolation = namedtuple('RuleViolation', ['path', 'name', 'is_dir', 'failed_rules', 'reason'])
+
+
+class RuleSet:
+    """Regole compilate una sola volta e valutate tutte in un unico passaggio per nome.
+
+    Quando possibile le regole sono fuse in un solo pattern di lookahead opzionali,
+    ognuno seguito da un gruppo vuoto che indica se la regola è soddisfatta.
+    Le regole a rischio di backtracking catastrofico, o che superano time_budget su
+    un nome, vengono valutate in un processo separato con un limite di tempo; quelle
+    che lo superano lì vengono sospese e restano in timed_out.
+    """
+
+    def __init__(self, rules, time_budget=RULE_TIME_BUDGET):
+        self.rules = [(description, regex) for description, regex in rules]
+        self.patterns = []
+        for i, (description, regex) in enumerate(self.rules, 1):
+            try:
+                self.patterns.append(re.compile(regex))
+            except re.error as e:
+                raise ValueError(f"Regola {i} non valida ({regex}): {e}")
+        self.dot_rules = frozenset(i for i, (description, _) in enumerate(self.rules) if description == DOT_RULE)
+        self.time_budget = time_budget
+        self.risky = {}
+        for i, (_, regex) in enumerate(self.rules):
+            reason = catastrophic_reason(regex)
+            if reason:
+                self.risky[i] = reason
+        # Il limite di tempo non può interrompere una regola valutata qui: quelle lente sul corpus
+        # di prova vanno subito nel processo di controllo, prima di incontrare un nome che le blocchi
+        candidates = [i for i in range(len(self.rules)) if i not in self.risky]
+        try:
+            slow = slow_rules([self.rules[i][1] for i in candidates], time_budget=time_budget)
+        except OSError:
+            # Senza processo di controllo resta solo la misura a posteriori in failed_indexes
+            slow = {}
+        for position, reason in slow.items():
+            self.risky[candidates[position]] = reason
+        self.inline = [i for i in range(len(self.rules)) if i not in self.risky]
+        self.guard = GuardedMatcher([regex for _, regex in self.rules], time_budget)
+        self.timed_out = {}
+        self.combined, self.markers = self.combine()
+        self.slow_combined = None
+        self.checked = 0
+
+    def copy(self):
+        """Stesse regole già compilate e analizzate, con contatori e processo di controllo nuovi."""
+        clone = copy.copy(self)
+        clone.risky = dict(self.risky)
+        clone.inline = list(self.inline)
+        clone.guard = GuardedMatcher([regex for _, regex in self.rules], self.time_budget)
+        clone.timed_out = {}
+        clone.slow_combined = None
+        clone.checked = 0
+        return clone
+
+    def combine(self):
+        rules = [(i, self.rules[i][1]) for i in self.inline]
+        if len(rules) < 2 or any(BACKREFERENCE.search(regex) for _, regex in rules):
+            return None, None
+        pattern = ''.join(f'(?:(?={regex})(?P<_rule{i}>))?' for i, regex in rules)
+        try:
+            combined = re.compile(pattern)
+        except re.error:
+            # Flag inline globali o nomi di gruppo ripetuti: si valutano le regole una per una
+            return None, None
+        return combined, [combined.groupindex[f'_rule{i}'] for i, _ in rules]
+
+    def failed_indexes(self, name):
+        """Restituisce (regole non rispettate, regole interrotte per il limite di tempo), numerate da 0."""
+        if self.combined is not None:
+            start = time.perf_counter()
+            matched = self.combined.match(name).group(*self.markers)
+            failed = [i for i, marker in zip(self.inline, matched) if marker is None]
+            if time.perf_counter() - start > self.time_budget:
+                # Più lento del previsto: da qui in poi le regole vengono misurate una per una
+                self.combined = None
+                self.slow_combined = name
+        else:
+            failed = []
+            for i in list(self.inline):
+                start = time.perf_counter()
+                if not self.patterns[i].match(name):
+                    failed.append(i)
+                if time.perf_counter() - start > self.time_budget:
+                    self.inline.remove(i)
+                    self.risky[i] = f"oltre {self.time_budget} s sul nome {name!r}"
+
+        timed_out = []
+        for i in self.risky:
+            if i in self.timed_out:
+                continue
+            try:
+                if not self.guard.match(i, name):
+                    failed.append(i)
+            except RuleTimeout:
+                self.timed_out[i] = name
+                timed_out.append(i)
+        return sorted(failed), timed_out
+
+    def evaluate(self, name, is_file, require_extension=False):
+        """Restituisce (regole non rispettate numerate da 1, motivo) oppure ([], None).
+
+        Una regola interrotta per il limite di tempo conta come non rispettata.
+        """
+        self.checked += 1
+        failed, timed_out = self.failed_indexes(name)
+        failed_rules = [i + 1 for i in failed if not (is_file and i in self.dot_rules)]
+        timed_out_rules = [i + 1 for i in timed_out if not (is_file and i in self.dot_rules)]
+        if failed_rules or timed_out_rules:
+            reasons = []
+            if failed_rules:
+                reasons.append(f"Non segue le regole: {', '.join(f'Regola {i}' for i in failed_rules)}")
+            if timed_out_rules:
+                reasons.append(f"Tempo limite superato: {', '.join(f'Regola {i}' for i in timed_out_rules)}")
+            return sorted(failed_rules + timed_out_rules), '; '.join(reasons)
+        if is_file and require_extension and not os.path.splitext(name)[1]:
+            return failed_rules, "File senza estensione"
+        if len(name) > 255:
+            return failed_rules, "Nome troppo lungo"
+        return failed_rules, None
+
+    def warnings(self):
+        """Messaggi sulle regole valutate con limite di tempo e su quelle sospese."""
+        messages = []
+        if self.slow_combined is not None:
+            messages.append(f"Il controllo combinato delle regole ha superato il limite di {self.time_budget} s "
+                            f"sul nome {self.slow_combined!r}: le regole vengono valutate una per una")
+        for i, reason in sorted(self.risky.items()):
+            if i in self.timed_out:
+                messages.append(f"Regola {i + 1} sospesa: ha superato il limite di {self.time_budget} s "
+                                f"sul nome {self.timed_out[i]!r}")
+            else:
+                messages.append(f"Regola {i + 1} valutata con limite di tempo ({reason})")
+        return messages
+
+    def close(self):
+        self.guard.close()
+
+    def check_entries(self, entries, require_extension=False):
+        for entry in entries:
+            try:
+                is_file = entry.is_file()
+            except OSError:
+                is_file = False
+            failed_rules, reason = self.evaluate(entry.name, is_file, require_extension)
+            if reason:
+                yield RuleViolation(entry.path, entry.name, not is_file and entry.is_dir(), failed_rules, reason)
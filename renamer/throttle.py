@@ -0,0 +1,84 @@
+import random
+import threading
+import time
+
+
+class _Bucket:
+    def __init__(self, per_minute, clock):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.available = self.capacity
+        self.clock = clock
+        self.updated = clock()
+
+    def refill(self):
+        now = self.clock()
+        self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount):
+        amount = min(amount, self.capacity)
+        if self.available >= amount:
+            return 0.0
+        return (amount - self.available) / self.rate
+
+
+class RateLimiter:
+    """Limita richieste e token al minuto (token bucket), condiviso tra più thread."""
+
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None, clock=time.monotonic, sleep=time.sleep):
+        self.requests = _Bucket(requests_per_minute, clock) if requests_per_minute else None
+        self.tokens = _Bucket(tokens_per_minute, clock) if tokens_per_minute else None
+        self.sleep = sleep
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens=0):
+        while True:
+            with self.lock:
+                wait = 0.0
+                for bucket, amount in ((self.requests, 1), (self.tokens, tokens)):
+                    if bucket:
+                        bucket.refill()
+                        wait = max(wait, bucket.wait_time(amount))
+                if wait == 0.0:
+                    if self.requests:
+                        self.requests.available -= 1
+                    if self.tokens:
+                        self.tokens.available -= min(tokens, self.tokens.capacity)
+                    return
+            self.sleep(wait)
+
+
+def is_retryable(error):
+    # Si evita di importare openai: bastano lo status HTTP o il nome della classe
+    status = getattr(error, 'status_code', None)
+    if status is not None:
+        return status == 429 or status >= 500
+    return type(error).__name__ in ('APIConnectionError', 'APITimeoutError')
+
+
+def retry_after(error):
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None) or {}
+    try:
+        return float(headers.get('retry-after'))
+    except (TypeError, ValueError):
+        return None
+
+
+def call_with_retry(func, max_retries=5, base_delay=1.0, max_delay=60.0, sleep=time.sleep, on_retry=None):
+    attempt = 0
+    while True:
+        try:
+            return func()
+        except Exception as e:
+            if attempt >= max_retries or not is_retryable(e):
+                raise
+            delay = retry_after(e)
+            if delay is None:
+                # Backoff esponenziale con jitter, per non far ripartire tutti i thread insieme
+                delay = min(max_delay, base_delay * 2 ** attempt) * random.uniform(0.5, 1.0)
+            if on_retry is not None:
+                on_retry(e)
+            sleep(delay)
+            attempt += 1
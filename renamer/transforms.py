@@ -0,0 +1,108 @@
+import json
+import os
+import re
+import unicodedata
+from datetime import date
+
+
+ILLEGAL_CHARACTERS = re.compile(r'[<>:"/\\|?*\x00-\x1f]')
+WHITESPACE = re.compile(r'\s+')
+NUMBER = re.compile(r'\d+')
+# Date con anno a quattro cifre: AAAA-MM-GG oppure GG-MM-AAAA (anche con . o _)
+DATE = re.compile(r'(?<!\d)(?:(?P<year>\d{4})[-._](?P<month>\d{1,2})[-._](?P<day>\d{1,2})'
+                  r'|(?P<day2>\d{1,2})[-._](?P<month2>\d{1,2})[-._](?P<year2>\d{4}))(?!\d)')
+
+DEFAULT_TRANSFORMS = {
+    'substitutions': [],
+    'strip_accents': True,
+    'strip_illegal': True,
+    'dates': True,
+    'date_format': '%Y%m%d',
+    'separator': '_',
+    'case': 'lower',
+    'pad_numbers': 0,
+    'extension': 'lower',
+}
+
+
+class LocalTransforms:
+    """Trasformazioni deterministiche applicate ai nomi prima di interpellare il modello.
+
+    Le opzioni sono quelle di DEFAULT_TRANSFORMS; substitutions è una lista di coppie
+    [espressione regolare, sostituzione] applicate in ordine al nome senza estensione.
+    """
+
+    def __init__(self, **options):
+        unknown = set(options) - set(DEFAULT_TRANSFORMS)
+        if unknown:
+            raise ValueError(f"Opzioni di trasformazione sconosciute: {', '.join(sorted(unknown))}")
+        self.options = dict(DEFAULT_TRANSFORMS, **options)
+        if self.options['case'] not in (None, 'lower', 'upper'):
+            raise ValueError("L'opzione case deve essere lower, upper oppure null.")
+        if self.options['extension'] not in ('keep', 'lower'):
+            raise ValueError("L'opzione extension deve essere keep oppure lower.")
+        try:
+            self.substitutions = [(re.compile(pattern), replacement)
+                                  for pattern, replacement in self.options['substitutions']]
+        except re.error as e:
+            raise ValueError(f"Sostituzione non valida: {e}")
+        self.resolved = 0
+
+    @classmethod
+    def load(cls, path='transforms.json'):
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            with open(path, 'r', encoding='utf-8') as f:
+                return cls(**json.load(f))
+        return cls()
+
+    def format_date(self, match):
+        year = match.group('year') or match.group('year2')
+        month = match.group('month') or match.group('month2')
+        day = match.group('day') or match.group('day2')
+        try:
+            return date(int(year), int(month), int(day)).strftime(self.options['date_format'])
+        except ValueError:
+            # Non è una data valida: il testo resta com'è
+            return match.group(0)
+
+    def pad(self, text):
+        if not self.options['pad_numbers']:
+            return text
+        return NUMBER.sub(lambda m: m.group(0).zfill(self.options['pad_numbers']), text)
+
+    def normalize_numbers(self, text):
+        """Normalizza le date e aggiunge zeri iniziali agli altri numeri, senza toccare le date."""
+        parts = []
+        last = 0
+        for match in DATE.finditer(text) if self.options['dates'] else ():
+            parts.append(self.pad(text[last:match.start()]))
+            parts.append(self.format_date(match))
+            last = match.end()
+        parts.append(self.pad(text[last:]))
+        return ''.join(parts)
+
+    def apply(self, name, is_file=True):
+        options = self.options
+        stem, extension = os.path.splitext(name) if is_file else (name, '')
+
+        for pattern, replacement in self.substitutions:
+            stem = pattern.sub(replacement, stem)
+        if options['strip_accents']:
+            stem = ''.join(c for c in unicodedata.normalize('NFKD', stem) if not unicodedata.combining(c))
+        if options['strip_illegal']:
+            stem = ILLEGAL_CHARACTERS.sub('', stem)
+            extension = ILLEGAL_CHARACTERS.sub('', extension)
+        stem = self.normalize_numbers(stem)
+        separator = options['separator']
+        if separator is not None:
+            stem = WHITESPACE.sub(separator, stem.strip())
+            if separator:
+                stem = re.sub(f'{re.escape(separator)}{{2,}}', separator, stem).strip(separator)
+        if options['case'] == 'lower':
+            stem = stem.lower()
+        elif options['case'] == 'upper':
+            stem = stem.upper()
+        if options['extension'] == 'lower':
+            extension = extension.lower()
+
+        return (stem + extension)[:255] if stem else name
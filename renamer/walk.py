@@ -0,0 +1,123 @@
+import fnmatch
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+def list_entries(root):
+    """Restituisce (dirs, files) come liste di DirEntry; il tipo arriva già dalla lettura della cartella."""
+    with os.scandir(root) as iterator:
+        entries = list(iterator)
+
+    dirs = []
+    files = []
+    for entry in entries:
+        try:
+            is_dir = entry.is_dir()
+        except OSError:
+            is_dir = False
+        (dirs if is_dir else files).append(entry)
+    return dirs, files
+
+
+class ParallelWalker:
+    """Come os.walk, ma con os.scandir e più cartelle lette contemporaneamente da un pool di thread.
+
+    Sulle condivisioni NFS/SMB il tempo è dominato dall'attesa di ogni elenco: mentre il
+    chiamante elabora una cartella, fino a max_pending cartelle vengono già lette. L'ordine
+    resta quello di os.walk (con topdown=False le cartelle figlie prima delle madri) e
+    le cartelle arrivano man mano, senza leggere prima tutto l'albero.
+
+    max_depth limita i livelli di sottocartelle visitati (0: solo la cartella iniziale);
+    include (pattern glob) seleziona i file da restituire, exclude scarta file e
+    cartelle, che in quel caso non vengono nemmeno visitate.
+    """
+
+    def __init__(self, workers=8, max_depth=None, include=None, exclude=None, max_pending=None):
+        self.workers = workers
+        self.max_depth = max_depth
+        self.include = list(include or [])
+        self.exclude = list(exclude or [])
+        self.max_pending = max_pending or workers * 4
+
+    def matches(self, name, patterns):
+        return any(fnmatch.fnmatch(name, pattern) for pattern in patterns)
+
+    def filter(self, dirs, files):
+        if self.exclude:
+            dirs = [entry for entry in dirs if not self.matches(entry.name, self.exclude)]
+            files = [entry for entry in files if not self.matches(entry.name, self.exclude)]
+        if self.include:
+            files = [entry for entry in files if self.matches(entry.name, self.include)]
+        return dirs, files
+
+    def walk(self, top, topdown=True, lister=list_entries, with_listing=False):
+        """Genera (cartella, dirs, files); lister(cartella) restituisce (dirs, files) e di default usa os.scandir.
+
+        Con with_listing aggiunge i nomi di tutti gli elementi della cartella, compresi quelli
+        scartati da include ed exclude, che servono per evitare collisioni nelle rinomine.
+        """
+        executor = ThreadPoolExecutor(max_workers=self.workers)
+        lock = threading.Lock()
+        # Letture avviate in anticipo e non ancora restituite, al massimo max_pending
+        pending = {}
+
+        def read(path, depth):
+            all_dirs, all_files = lister(path)
+            dirs, files = self.filter(all_dirs, all_files)
+            listing = (dirs, files)
+            if with_listing:
+                listing += ([entry.name for entry in all_dirs + all_files],)
+            children = []
+            if self.max_depth is None or depth < self.max_depth:
+                # Come os.walk senza followlinks: non si scende nei link simbolici a cartelle
+                children = [entry.path for entry in dirs if not entry.is_symlink()]
+            # Le sottocartelle si leggono subito, senza aspettare che il chiamante arrivi fin lì
+            for child in children:
+                if not schedule(child, depth + 1):
+                    break
+            return listing, children
+
+        def schedule(path, depth):
+            with lock:
+                if path in pending:
+                    return True
+                if len(pending) >= self.max_pending:
+                    return False
+                try:
+                    pending[path] = executor.submit(read, path, depth)
+                except RuntimeError:
+                    # Visita interrotta dal chiamante
+                    return False
+                return True
+
+        # Ogni nodo è (percorso, profondità, (dirs, files, ...) in attesa delle figlie)
+        stack = [(top, 0, None)]
+        try:
+            while stack:
+                for path, depth, listing in reversed(stack[-self.max_pending:]):
+                    if listing is None:
+                        schedule(path, depth)
+                root, depth, listing = stack.pop()
+                if listing is not None:
+                    yield (root,) + listing
+                    continue
+                with lock:
+                    future = pending.get(root) or executor.submit(read, root, depth)
+                try:
+                    listing, children = future.result()
+                except OSError:
+                    continue
+                finally:
+                    with lock:
+                        pending.pop(root, None)
+                if topdown:
+                    yield (root,) + listing
+                else:
+                    stack.append((root, depth, listing))
+                stack.extend(reversed([(child, depth + 1, None) for child in children]))
+        finally:
+            with lock:
+                for future in pending.values():
+                    future.cancel()
+                executor.shutdown(wait=False)
@@ -0,0 +1,351 @@
+import ctypes
+import ctypes.util
+import errno
+import fnmatch
+import os
+import select
+import struct
+import sys
+import threading
+import time
+
+from .metrics import STAGE_BATCH, STAGE_LATENCY
+from .walk import ParallelWalker
+
+
+# Secondi senza modifiche dopo i quali un file viene considerato completo
+SETTLE_SECONDS = 2.0
+# Un gruppo parte dopo WINDOW_SECONDS dal primo file pronto, o prima se raggiunge BATCH_SIZE file
+WINDOW_SECONDS = 10.0
+BATCH_SIZE = 50
+POLL_INTERVAL = 2.0
+# File temporanei di browser, programmi di copia e Office: vengono rinominati a fine scrittura
+TEMP_PATTERNS = ('*.part', '*.partial', '*.tmp', '*.temp', '*.crdownload', '*.download', '*.!ut', '~$*', '.~lock.*',
+                 '.*.swp')
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE_SELF | IN_MOVE_SELF
+EVENT_HEADER = struct.Struct('iIII')
+
+
+class InotifySource:
+    """Eventi del kernel Linux: un file è un candidato quando viene chiuso dopo la scrittura o spostato qui.
+
+    I file ancora aperti in scrittura non generano eventi. Le nuove sottocartelle
+    vengono osservate appena create e i file che contengono già diventano candidati.
+    """
+
+    def __init__(self, roots, walker):
+        if not sys.platform.startswith('linux'):
+            raise OSError("inotify è disponibile solo su Linux.")
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.walker = walker
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, f"inotify non disponibile: {os.strerror(error)}")
+        self.watches = {}
+        self.overflows = 0
+        try:
+            for root in roots:
+                self.add_tree(os.path.abspath(root), 0)
+        except OSError:
+            self.close()
+            raise
+
+    def add_watch(self, path, depth):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            error = ctypes.get_errno()
+            if error == errno.ENOSPC:
+                raise OSError(error, "Limite di cartelle osservabili raggiunto "
+                                     "(aumenta fs.inotify.max_user_watches o usa --polling)")
+            # Cartella sparita nel frattempo o non leggibile
+            return False
+        self.watches[wd] = (path, depth)
+        return True
+
+    def add_tree(self, path, depth):
+        """Osserva path e le sottocartelle; restituisce i file che contengono già."""
+        if not self.add_watch(path, depth):
+            return []
+        walker = self.walker
+        if walker.max_depth is not None and depth:
+            # max_depth vale dalla cartella osservata, non dalla sottocartella appena aggiunta
+            walker = ParallelWalker(walker.workers, max(walker.max_depth - depth, 0), walker.include, walker.exclude)
+        found = []
+        for root, dirs, files in walker.walk(path):
+            root_depth = depth + root[len(path):].count(os.sep)
+            if root != path:
+                self.add_watch(root, root_depth)
+            found.extend(entry.path for entry in files)
+        return found
+
+    def remove_tree(self, path):
+        prefix = path + os.sep
+        for wd, (watched, _) in list(self.watches.items()):
+            if watched == path or watched.startswith(prefix):
+                self.libc.inotify_rm_watch(self.fd, wd)
+                del self.watches[wd]
+
+    def read_events(self):
+        data = b''
+        while True:
+            try:
+                chunk = os.read(self.fd, 65536)
+            except BlockingIOError:
+                return data
+            if not chunk:
+                return data
+            data += chunk
+
+    def poll(self, timeout):
+        """Restituisce i percorsi dei file candidati arrivati entro timeout secondi."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        data = self.read_events()
+        paths = []
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                self.overflows += 1
+                continue
+            if mask & IN_IGNORED:
+                self.watches.pop(wd, None)
+                continue
+            if wd not in self.watches or not name:
+                continue
+            root, depth = self.watches[wd]
+            path = os.path.join(root, name)
+            if mask & IN_ISDIR:
+                if mask & IN_MOVED_FROM:
+                    self.remove_tree(path)
+                elif (mask & (IN_CREATE | IN_MOVED_TO) and not self.walker.matches(name, self.walker.exclude)
+                      and (self.walker.max_depth is None or depth < self.walker.max_depth)):
+                    paths.extend(self.add_tree(path, depth + 1))
+            elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                paths.append(path)
+        return paths
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+class PollingSource:
+    """Alternativa a inotify (altri sistemi, condivisioni di rete): confronta elenchi successivi delle cartelle.
+
+    Sono candidati i file nuovi o cambiati rispetto alla lettura precedente.
+    """
+
+    def __init__(self, roots, walker, interval=POLL_INTERVAL, clock=time.monotonic):
+        self.roots = [os.path.abspath(root) for root in roots]
+        self.walker = walker
+        self.interval = interval
+        self.clock = clock
+        self.overflows = 0
+        self.snapshot = self.scan()
+        self.next_scan = clock() + interval
+
+    def scan(self):
+        snapshot = {}
+        for top in self.roots:
+            for _, _, files in self.walker.walk(top):
+                for entry in files:
+                    try:
+                        stat_result = entry.stat()
+                    except OSError:
+                        continue
+                    snapshot[entry.path] = (stat_result.st_size, stat_result.st_mtime_ns)
+        return snapshot
+
+    def poll(self, timeout):
+        wait = self.next_scan - self.clock()
+        if wait > timeout:
+            time.sleep(timeout)
+            return []
+        time.sleep(max(wait, 0))
+        snapshot = self.scan()
+        self.next_scan = self.clock() + self.interval
+        changed = [path for path, signature in snapshot.items() if self.snapshot.get(path) != signature]
+        self.snapshot = snapshot
+        return changed
+
+    def close(self):
+        pass
+
+
+def file_signature(path):
+    stat_result = os.stat(path)
+    return stat_result.st_size, stat_result.st_mtime_ns
+
+
+class FolderWatcher:
+    """Rinomina i file che arrivano nelle cartelle osservate, a gruppi, con il prompt e le regole del motore.
+
+    Un file entra in un gruppo quando dimensione e data di modifica restano uguali
+    per settle secondi; i file temporanei (TEMP_PATTERNS) vengono ignorati finché
+    non prendono il nome definitivo. Il gruppo parte window secondi dopo il primo
+    file pronto, o appena raggiunge batch_size file. Le rinomine fatte dal watcher
+    stesso non vengono rielaborate. Per ogni gruppo on_batch riceve le statistiche
+    e le coppie (vecchio, nuovo percorso).
+    """
+
+    def __init__(self, engine, roots, prompt, window=WINDOW_SECONDS, batch_size=BATCH_SIZE, settle=SETTLE_SECONDS,
+                 polling=False, poll_interval=POLL_INTERVAL, journal_dir='.', on_batch=None, on_error=None,
+                 clock=time.monotonic):
+        self.engine = engine
+        self.roots = list(roots)
+        self.prompt = prompt
+        self.window = window
+        self.batch_size = batch_size
+        self.settle = settle
+        self.polling = polling
+        self.poll_interval = poll_interval
+        self.journal_dir = journal_dir
+        self.on_batch = on_batch
+        self.on_error = on_error
+        self.clock = clock
+        self.walker = engine.walker if isinstance(engine.walker, ParallelWalker) else ParallelWalker()
+        # Percorso -> (firma, istante dell'ultima modifica vista, istante del primo evento)
+        self.candidates = {}
+        # Percorso -> (istante del primo evento, istante in cui è diventato pronto)
+        self.ready = {}
+        # Percorsi creati dalle rinomine del watcher -> scadenza
+        self.own = {}
+        self.source = None
+        self.batches = 0
+
+    def open_source(self):
+        if not self.polling:
+            try:
+                return InotifySource(self.roots, self.walker)
+            except (OSError, AttributeError) as e:
+                if self.on_error is not None:
+                    self.on_error(f"inotify non disponibile ({e}), uso il controllo periodico")
+        return PollingSource(self.roots, self.walker, self.poll_interval, self.clock)
+
+    @property
+    def mode(self):
+        return 'polling' if isinstance(self.source, PollingSource) else 'inotify'
+
+    def accepted(self, path):
+        name = os.path.basename(path)
+        if any(fnmatch.fnmatch(name, pattern) for pattern in TEMP_PATTERNS):
+            return False
+        if self.walker.exclude and self.walker.matches(name, self.walker.exclude):
+            return False
+        return not self.walker.include or self.walker.matches(name, self.walker.include)
+
+    def observe(self, path, now):
+        if path in self.own or path in self.ready or not self.accepted(path):
+            return
+        try:
+            signature = file_signature(path)
+        except OSError:
+            return
+        previous = self.candidates.get(path)
+        first_seen = previous[2] if previous else now
+        if previous is None or previous[0] != signature:
+            self.candidates[path] = (signature, now, first_seen)
+
+    def settle_candidates(self, now):
+        for path, (signature, since, first_seen) in list(self.candidates.items()):
+            if now - since < self.settle:
+                continue
+            try:
+                current = file_signature(path)
+            except OSError:
+                del self.candidates[path]
+                continue
+            if current != signature:
+                # Ancora in scrittura
+                self.candidates[path] = (current, now, first_seen)
+                continue
+            del self.candidates[path]
+            self.ready[path] = (first_seen, now)
+
+    def batch_due(self, now):
+        if not self.ready:
+            return False
+        oldest = min(ready_at for _, ready_at in self.ready.values())
+        return len(self.ready) >= self.batch_size or now - oldest >= self.window
+
+    def journal_path(self):
+        name = time.strftime('rename-journal-%Y%m%d-%H%M%S') + f'-{self.batches}.jsonl'
+        return os.path.join(self.journal_dir, name)
+
+    def process_batch(self, stop=None):
+        """Rinomina i file pronti (al massimo batch_size) e restituisce le statistiche del gruppo."""
+        paths = sorted(self.ready, key=lambda path: self.ready[path][1])[:self.batch_size]
+        times = {path: self.ready.pop(path) for path in paths}
+        self.batches += 1
+        start = self.clock()
+        error = None
+        applied = []
+        try:
+            applied = self.engine.rename_files(paths, self.prompt, stop, self.journal_path())
+        except (ValueError, OSError) as e:
+            error = str(e)
+        except Exception as e:
+            # Errori del modello dopo tutti i tentativi: il watcher continua con i file successivi
+            error = f"{type(e).__name__}: {e}"
+        end = self.clock()
+        expiry = end + max(60.0, 10 * self.poll_interval)
+        for _, new_path in applied:
+            self.own[new_path] = expiry
+        latencies = [end - first_seen for first_seen, _ in times.values()]
+        self.engine.metrics.observe(STAGE_BATCH, end - start)
+        for latency in latencies:
+            self.engine.metrics.observe(STAGE_LATENCY, latency)
+        stats = {
+            'batch': self.batches,
+            'files': len(paths),
+            'renamed': len(applied),
+            'seconds': round(end - start, 3),
+            'latency_avg': round(sum(latencies) / len(latencies), 3),
+            'latency_max': round(max(latencies), 3),
+            'journal': self.engine.last_journal.path if applied else None,
+            'error': error,
+        }
+        if self.on_batch is not None:
+            self.on_batch(stats, applied)
+        return stats
+
+    def expire_own(self, now):
+        for path, expiry in list(self.own.items()):
+            if expiry < now:
+                del self.own[path]
+
+    def run(self, stop=None):
+        """Osserva le cartelle finché stop (threading.Event) non viene impostato."""
+        stop = stop or threading.Event()
+        self.source = self.open_source()
+        # Controlli frequenti quanto serve per rispettare settle e window
+        tick = max(0.05, min(0.5, self.settle / 2 or 0.5, self.window / 2 or 0.5))
+        try:
+            while not stop.is_set():
+                paths = self.source.poll(tick)
+                now = self.clock()
+                for path in paths:
+                    self.observe(path, now)
+                self.settle_candidates(now)
+                self.expire_own(now)
+                while self.batch_due(self.clock()) and not stop.is_set():
+                    self.process_batch(stop)
+        finally:
+            self.source.close()
@@ -0,0 +1,67 @@
+import unittest
+
+from renamer.bench import FakeClient
+from renamer.dedup import fan_out, group_by_pattern, pattern_key
+from renamer.engine import RenameEngine
+
+
+class GroupByPatternTest(unittest.TestCase):
+
+    def test_stessa_chiave_per_nomi_che_differiscono_solo_nei_numeri(self):
+        self.assertEqual(pattern_key('IMG_0001.jpg'), pattern_key('IMG_12.jpg'))
+        self.assertNotEqual(pattern_key('IMG_0001.jpg'), pattern_key('IMG_0001.png'))
+
+    def test_gruppi_nell_ordine_di_prima_apparizione(self):
+        groups = group_by_pattern(['IMG_0001.jpg', 'nota.txt', 'IMG_0002.jpg', 'scan 1.pdf', 'IMG_0003.jpg'])
+        self.assertEqual(list(groups), ['IMG_0001.jpg', 'nota.txt', 'scan 1.pdf'])
+        self.assertEqual(groups['IMG_0001.jpg'], ['IMG_0002.jpg', 'IMG_0003.jpg'])
+        self.assertEqual(groups['nota.txt'], [])
+
+    def test_nomi_senza_cifre_uguali_restano_separati(self):
+        self.assertEqual(group_by_pattern(['a.txt', 'b.txt']), {'a.txt': [], 'b.txt': []})
+
+
+class FanOutTest(unittest.TestCase):
+
+    def test_sostituisce_i_numeri_del_membro(self):
+        self.assertEqual(fan_out('IMG_0001.jpg', 'Foto vacanza 0001.jpg', 'IMG_0042.jpg'), 'Foto vacanza 0042.jpg')
+
+    def test_piu_numeri_nello_stesso_ordine(self):
+        self.assertEqual(fan_out('2021-03 scan 7.pdf', 'scansione_2021_03_007.pdf', '2022-11 scan 8.pdf'), None)
+        self.assertEqual(fan_out('2021-03 scan 7.pdf', 'scansione_7_2021_03.pdf', '2022-11 scan 8.pdf'), None)
+        self.assertEqual(fan_out('2021-03 scan 7.pdf', 'scansione_2021_03_7.pdf', '2022-11 scan 8.pdf'),
+                         'scansione_2022_11_8.pdf')
+
+    def test_numero_assente_dal_nuovo_nome(self):
+        self.assertIsNone(fan_out('IMG_0001.jpg', 'Foto vacanza.jpg', 'IMG_0002.jpg'))
+
+    def test_numero_ripetuto_nel_nuovo_nome(self):
+        self.assertIsNone(fan_out('IMG_1.jpg', 'Foto 1 di 1.jpg', 'IMG_2.jpg'))
+
+    def test_numero_ripetuto_nel_rappresentante(self):
+        self.assertIsNone(fan_out('a1b1.jpg', 'x1.jpg', 'a2b3.jpg'))
+
+    def test_numero_di_cifre_diverso(self):
+        self.assertIsNone(fan_out('a1.jpg', 'x1.jpg', 'a2b3.jpg'))
+
+
+class PatternDedupTest(unittest.TestCase):
+
+    def test_un_solo_nome_chiesto_per_schema(self):
+        client = FakeClient()
+        engine = RenameEngine(client=client, pattern_dedup=True, concurrency=1)
+        names = [f'IMG_{i:04d}.JPG' for i in range(1, 51)]
+        self.assertEqual(engine.name_groups([names], 'prompt')[0], [name.lower() for name in names])
+        self.assertEqual(client.calls, 1)
+
+    def test_nomi_non_estendibili_chiesti_al_modello(self):
+        client = FakeClient()
+        engine = RenameEngine(client=client, pattern_dedup=True, concurrency=1)
+        new_names = engine.name_groups([['IMG_0001.jpg', 'IMG_0002.jpg', 'a1b1.jpg', 'a2b3.jpg']], 'prompt')[0]
+        self.assertEqual(new_names, ['img_0001.jpg', 'img_0002.jpg', 'a1b1.jpg', 'a2b3.jpg'])
+        # a2b3.jpg non si ricava da a1b1.jpg: serve una seconda richiesta
+        self.assertEqual(client.calls, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
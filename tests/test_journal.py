@@ -0,0 +1,141 @@
+import os
+import tempfile
+import threading
+import unittest
+
+from renamer.journal import RenameJournal, order_moves, plan_directory, resolve_targets
+
+
+class ResolveTargetsTest(unittest.TestCase):
+
+    def test_collisioni_con_nomi_esistenti(self):
+        targets = resolve_targets(['a.txt', 'b.txt', 'report.txt'], [('a.txt', 'report.txt'), ('b.txt', 'report.txt')])
+        self.assertEqual(targets, [('a.txt', 'report_1.txt'), ('b.txt', 'report_2.txt')])
+
+    def test_nome_liberato_da_un_altra_rinomina(self):
+        targets = resolve_targets(['a.txt', 'b.txt'], [('a.txt', 'b.txt'), ('b.txt', 'c.txt')])
+        self.assertEqual(targets, [('a.txt', 'b.txt'), ('b.txt', 'c.txt')])
+
+    def test_nomi_invariati_o_non_validi_ignorati(self):
+        targets = resolve_targets(['a.txt', 'b.txt', 'c.txt'], [('a.txt', 'a.txt'), ('b.txt', ''), ('c.txt', '..')])
+        self.assertEqual(targets, [])
+
+    def test_nome_di_un_elemento_non_rinominato_resta_occupato(self):
+        targets = resolve_targets(['a', 'b', 'c'], [('a', 'b'), ('b', '..'), ('c', '')])
+        self.assertEqual(targets, [('a', 'b_1')])
+        targets = resolve_targets(['a', 'c'], [('a', 'c'), ('c', '')])
+        self.assertEqual(targets, [('a', 'c_1')])
+
+
+class OrderMovesTest(unittest.TestCase):
+
+    def test_scambio_passa_da_un_nome_temporaneo(self):
+        moves = order_moves('/d', ['a', 'b'], [('a', 'b'), ('b', 'a')])
+        self.assertEqual(moves, [('/d', 'a', '.renamer-0.tmp'), ('/d', 'b', '.renamer-1.tmp'),
+                                 ('/d', '.renamer-0.tmp', 'b'), ('/d', '.renamer-1.tmp', 'a')])
+
+    def test_catena(self):
+        moves = order_moves('/d', ['a', 'b'], [('a', 'b'), ('b', 'c')])
+        self.assertEqual(moves, [('/d', 'a', '.renamer-0.tmp'), ('/d', 'b', 'c'), ('/d', '.renamer-0.tmp', 'b')])
+
+    def test_nome_temporaneo_gia_occupato(self):
+        moves = order_moves('/d', ['a', 'b', '.renamer-0.tmp'], [('a', 'b'), ('b', 'a')])
+        self.assertEqual(moves[0], ('/d', 'a', '.renamer-0_1.tmp'))
+
+
+class RenameJournalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp.cleanup)
+        self.root = os.path.join(self.temp.name, 'cartella')
+        os.mkdir(self.root)
+        self.journal_path = os.path.join(self.temp.name, 'journal.jsonl')
+
+    def write(self, root, name, content):
+        with open(os.path.join(root, name), 'w', encoding='utf-8') as f:
+            f.write(content)
+
+    def contents(self, root):
+        result = {}
+        for name in sorted(os.listdir(root)):
+            path = os.path.join(root, name)
+            if os.path.isfile(path):
+                with open(path, 'r', encoding='utf-8') as f:
+                    result[name] = f.read()
+        return result
+
+    def create(self, moves):
+        return RenameJournal.create(self.journal_path, {'directory': self.temp.name}, moves)
+
+    def test_scambio_e_catena_applicati(self):
+        for name in ('a', 'b', 'c'):
+            self.write(self.root, name, name)
+        moves = plan_directory(self.root, ['a', 'b', 'c'], [('a', 'b'), ('b', 'a'), ('c', 'd')])
+        self.create(moves).apply()
+        self.assertEqual(self.contents(self.root), {'a': 'b', 'b': 'a', 'd': 'c'})
+
+    def test_ripresa_dopo_un_crash(self):
+        for name in ('a', 'b'):
+            self.write(self.root, name, name)
+        moves = plan_directory(self.root, ['a', 'b'], [('a', 'b'), ('b', 'a')])
+        self.create(moves)
+        # Crash dopo il primo spostamento, prima di scrivere la riga "done"
+        os.rename(os.path.join(self.root, 'a'), os.path.join(self.root, moves[0][2]))
+
+        journal = RenameJournal.load(self.journal_path)
+        self.assertEqual(journal.pending(), list(range(len(moves))))
+        journal.apply()
+        self.assertEqual(self.contents(self.root), {'a': 'b', 'b': 'a'})
+        self.assertEqual(RenameJournal.load(self.journal_path).pending(), [])
+
+    def test_ripresa_dopo_un_interruzione_tra_cartelle(self):
+        other = os.path.join(self.temp.name, 'altra')
+        os.mkdir(other)
+        self.write(self.root, 'a', 'a')
+        self.write(other, 'x', 'x')
+        moves = plan_directory(self.root, ['a'], [('a', 'b')]) + plan_directory(other, ['x'], [('x', 'y')])
+        stop = threading.Event()
+
+        class StopAfterFirst:
+            def start_phase(self, phase, total):
+                pass
+
+            def advance(self):
+                stop.set()
+
+        journal = self.create(moves)
+        journal.apply(stop=stop, progress=StopAfterFirst())
+        self.assertEqual(journal.pending(), [1])
+        self.assertEqual(self.contents(other), {'x': 'x'})
+
+        journal = RenameJournal.load(self.journal_path)
+        self.assertEqual(journal.pending(), [1])
+        journal.apply()
+        self.assertEqual(self.contents(self.root), {'b': 'a'})
+        self.assertEqual(self.contents(other), {'y': 'x'})
+
+    def test_annullamento(self):
+        for name in ('a', 'b', 'c'):
+            self.write(self.root, name, name)
+        moves = plan_directory(self.root, ['a', 'b', 'c'], [('a', 'b'), ('b', 'a'), ('c', 'd')])
+        self.create(moves).apply()
+
+        journal = RenameJournal.load(self.journal_path)
+        restored = journal.undo()
+        self.assertEqual(len(restored), len(moves))
+        self.assertEqual(self.contents(self.root), {'a': 'a', 'b': 'b', 'c': 'c'})
+        # Un secondo annullamento non ripete gli spostamenti già annullati
+        self.assertEqual(RenameJournal.load(self.journal_path).undo(), [])
+
+    def test_destinazione_occupata(self):
+        for name in ('a', 'b'):
+            self.write(self.root, name, name)
+        journal = self.create([(self.root, 'a', 'b')])
+        with self.assertRaises(FileExistsError):
+            journal.apply()
+        self.assertEqual(self.contents(self.root), {'a': 'a', 'b': 'b'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import re
+import unittest
+
+from renamer.engine import DEFAULT_RULES
+from renamer.regex_guard import GuardedMatcher, RuleTimeout, catastrophic_reason, validate_rule
+from renamer.rules import RuleSet
+
+# Esponenziale su una serie di 'a' che non termina come previsto
+NESTED = r'^(a+)+$'
+BAD_NAME = 'a' * 40 + '!'
+
+
+class CatastrophicReasonTest(unittest.TestCase):
+
+    def test_quantificatori_annidati(self):
+        for regex in (NESTED, r'^(\w+\s?)*$', r'^([a-z]*)*x$'):
+            self.assertEqual(catastrophic_reason(regex), "quantificatori annidati", regex)
+
+    def test_alternative_sovrapposte(self):
+        self.assertEqual(catastrophic_reason(r'^(a|ab)*$'), "alternative sovrapposte dentro una ripetizione")
+
+    def test_regole_sicure(self):
+        for regex in [regex for _, regex in DEFAULT_RULES] + [r'^([a-z]+_)*[a-z]+$', r'^(?:a+)++$', r'^\d{8}_.*$']:
+            self.assertIsNone(catastrophic_reason(regex), regex)
+
+    def test_regola_non_valida(self):
+        with self.assertRaises(ValueError):
+            catastrophic_reason('([a-z')
+
+
+class GuardedMatcherTest(unittest.TestCase):
+
+    def test_corrispondenze_e_limite_di_tempo(self):
+        matcher = GuardedMatcher([r'^[a-z]+$', NESTED], time_budget=0.2)
+        self.addCleanup(matcher.close)
+        self.assertTrue(matcher.match(0, 'abc'))
+        self.assertFalse(matcher.match(0, 'ABC'))
+        with self.assertRaises(RuleTimeout) as raised:
+            matcher.match(1, BAD_NAME)
+        self.assertEqual(raised.exception.index, 1)
+        # Il processo bloccato viene chiuso e sostituito alla chiamata successiva
+        self.assertTrue(matcher.match(0, 'abc'))
+
+    def test_validate_rule(self):
+        validate_rule(r'^[a-z0-9_]+\.[a-z]+$')
+        with self.assertRaises(ValueError):
+            validate_rule(NESTED)
+        with self.assertRaises(ValueError):
+            validate_rule(r'^(.*)(.*)(.*)(.*)(.*)x$', time_budget=0.05)
+
+
+class RuleSetTest(unittest.TestCase):
+
+    def ruleset(self, rules, time_budget=0.2):
+        ruleset = RuleSet(rules, time_budget)
+        self.addCleanup(ruleset.close)
+        return ruleset
+
+    def test_pattern_combinato_come_le_regole_una_per_una(self):
+        ruleset = self.ruleset(DEFAULT_RULES)
+        self.assertIsNotNone(ruleset.combined)
+        for name in ('relazione_2021', 'Foto Vacanza.JPG', '.gitignore', '', 'a' * 300, 'àèì'):
+            expected = [i for i, (_, regex) in enumerate(DEFAULT_RULES) if not re.match(regex, name)]
+            self.assertEqual(ruleset.failed_indexes(name), (expected, []), name)
+
+    def test_riferimenti_ai_gruppi_valutati_una_per_una(self):
+        ruleset = self.ruleset(DEFAULT_RULES + [("Lettera doppia", r'^.*(\w)\1')])
+        self.assertIsNone(ruleset.combined)
+        self.assertEqual(ruleset.failed_indexes('abba')[0], [])
+        self.assertEqual(ruleset.failed_indexes('abc')[0], [3])
+
+    def test_regola_a_rischio_valutata_con_limite_di_tempo(self):
+        ruleset = self.ruleset(DEFAULT_RULES + [("Solo a", NESTED)])
+        self.assertEqual(ruleset.risky, {3: "quantificatori annidati"})
+        self.assertEqual(ruleset.inline, [0, 1, 2])
+        self.assertEqual(ruleset.evaluate('aaa', True), ([], None))
+        failed, reason = ruleset.evaluate(BAD_NAME, True)
+        self.assertEqual(failed, [1, 4])
+        self.assertIn("Tempo limite superato: Regola 4", reason)
+        # Dopo il primo blocco la regola resta sospesa per il resto della scansione
+        self.assertEqual(ruleset.failed_indexes('aaa'), ([], []))
+        self.assertIn(3, ruleset.timed_out)
+        self.assertTrue(any("Regola 4 sospesa" in message for message in ruleset.warnings()))
+
+    def test_regola_lenta_sul_corpus_spostata_nel_processo_di_controllo(self):
+        ruleset = self.ruleset(DEFAULT_RULES + [("Finisce con x", r'^(.*)(.*)(.*)(.*)(.*)x$')], time_budget=0.05)
+        self.assertIn(3, ruleset.risky)
+        self.assertNotIn(3, ruleset.inline)
+
+    def test_copia_con_contatori_nuovi(self):
+        ruleset = self.ruleset(DEFAULT_RULES + [("Solo a", NESTED)])
+        ruleset.evaluate(BAD_NAME, True)
+        clone = ruleset.copy()
+        self.addCleanup(clone.close)
+        self.assertEqual((clone.checked, clone.timed_out), (0, {}))
+        self.assertEqual(clone.evaluate('aaa', True), ([], None))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import os
+import tempfile
+import unittest
+
+from renamer.walk import ParallelWalker
+
+
+class ParallelWalkerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp.cleanup)
+        self.top = self.temp.name
+        for directory in ('a/a1/a11', 'a/a2', 'b', 'skip/inner'):
+            os.makedirs(os.path.join(self.top, directory))
+        for path in ('x.txt', 'y.jpg', 'a/a.txt', 'a/a1/a1.txt', 'a/a1/a11/deep.txt', 'a/a2/a2.jpg', 'b/b.txt',
+                     'skip/s.txt', 'skip/inner/i.txt'):
+            open(os.path.join(self.top, path), 'w').close()
+
+    def relative(self, root):
+        return os.path.relpath(root, self.top)
+
+    def walk(self, walker, topdown=True, with_listing=False):
+        result = []
+        for root, dirs, files, *listing in walker.walk(self.top, topdown, with_listing=with_listing):
+            entry = (self.relative(root), sorted(entry.name for entry in dirs), sorted(entry.name for entry in files))
+            result.append(entry + tuple(sorted(names) for names in listing))
+        return result
+
+    def expected_walk(self, topdown):
+        return [(self.relative(root), sorted(dirs), sorted(files))
+                for root, dirs, files in os.walk(self.top, topdown)]
+
+    def test_stesso_ordine_di_os_walk(self):
+        for workers in (1, 8):
+            for topdown in (True, False):
+                walker = ParallelWalker(workers=workers, max_pending=2)
+                self.assertEqual([root for root, _, _ in self.walk(walker, topdown)],
+                                 [root for root, _, _ in self.expected_walk(topdown)], (workers, topdown))
+
+    def test_stessi_elementi_di_os_walk(self):
+        self.assertEqual(sorted(self.walk(ParallelWalker())), sorted(self.expected_walk(True)))
+
+    def test_figlie_prima_delle_madri(self):
+        roots = [root for root, _, _ in self.walk(ParallelWalker(), topdown=False)]
+        for root in roots:
+            parent = os.path.dirname(root)
+            if parent:
+                self.assertLess(roots.index(root), roots.index(parent))
+        self.assertEqual(roots[-1], '.')
+
+    def test_max_depth(self):
+        roots = [root for root, _, _ in self.walk(ParallelWalker(max_depth=1))]
+        self.assertEqual(sorted(roots), ['.', 'a', 'b', 'skip'])
+        self.assertEqual([root for root, _, _ in self.walk(ParallelWalker(max_depth=0))], ['.'])
+
+    def test_include_seleziona_solo_i_file(self):
+        walked = {root: (dirs, files) for root, dirs, files in self.walk(ParallelWalker(include=['*.txt']))}
+        self.assertEqual(walked['.'], (['a', 'b', 'skip'], ['x.txt']))
+        self.assertEqual(walked[os.path.join('a', 'a2')], ([], []))
+        self.assertIn(os.path.join('a', 'a1', 'a11'), walked)
+
+    def test_exclude_scarta_file_e_cartelle(self):
+        walked = {root: (dirs, files) for root, dirs, files in self.walk(ParallelWalker(exclude=['skip', '*.jpg']))}
+        self.assertEqual(walked['.'], (['a', 'b'], ['x.txt']))
+        self.assertNotIn('skip', walked)
+        self.assertNotIn(os.path.join('skip', 'inner'), walked)
+
+    def test_with_listing_contiene_anche_gli_elementi_filtrati(self):
+        walker = ParallelWalker(include=['*.txt'], exclude=['skip'])
+        walked = {root: rest for root, *rest in self.walk(walker, with_listing=True)}
+        self.assertEqual(walked['.'], [['a', 'b'], ['x.txt'], ['a', 'b', 'skip', 'x.txt', 'y.jpg']])
+
+    def test_cartella_che_non_si_puo_leggere(self):
+        walker = ParallelWalker()
+        self.assertEqual(list(walker.walk(os.path.join(self.top, 'inesistente'))), [])
+
+
+if __name__ == '__main__':
+    unittest.main()